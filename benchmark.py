@@ -0,0 +1,161 @@
+"""
+Offline load test for /place-oco against modules/fake_gateway.py.
+
+Runs the server in-process with a generated config (no config.yaml, no
+network, no Discord alerts) and reports throughput, latency percentiles
+and gateway calls per bracket:
+
+    python benchmark.py --requests 200 --concurrency 20 --latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import yaml
+
+from modules.fake_gateway import FakeGateway
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100.0 * len(ordered)) - 1)  # nearest rank
+    return ordered[index]
+
+def write_config(directory, fake, args):
+    config = {
+        "username": "bench",
+        "api_key": "bench",
+        "account_id": "1",
+        "discord": "",
+        "api_url": fake.api_url,
+        "user_api_url": fake.user_api_url,
+        "order_stream": "off",
+        "market_data": "off",
+        "state_dir": os.path.join(directory, "state"),
+        "journal_path": os.path.join(directory, "journal", "trades.jsonl"),
+        "bracket_mode": args.bracket_mode,
+    }
+    if not args.rate_limits:
+        config["rate_limits"] = {"api": [1e9, 1e9], "history": [1e9, 1e9]}
+    path = os.path.join(directory, "config.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f)
+    return path
+
+async def run(args):
+    fake = FakeGateway(
+        latency=args.latency,
+        jitter=args.jitter,
+        fail_rate=args.fail_rate,
+        lost_ack_rate=args.lost_ack_rate,
+        fill_after=args.fill_after,
+        exit_after=args.exit_after,
+        # Enough budget that the risk engine sizes every bracket instead of rejecting it
+        accounts=[{"accountId": 1, "balance": args.balance, "maximumLoss": 0.0}],
+        seed=args.seed
+    )
+    await fake.start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The server reads its config at import time
+        os.environ["TSX_CONFIG"] = write_config(directory, fake, args)
+        import tsx_api_server as server
+        if not args.verbose:
+            server.logging.getLogger().setLevel(server.logging.WARNING)
+
+        payload = {"symbol": args.symbol, "op": args.op, "tp": args.tp, "sl": args.sl}
+        latencies = []
+        statuses = {}
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async with server.app.test_app() as test_app:
+            client = test_app.test_client()
+            await client.post("/place-oco", json=payload)  # warm up pools, token, account cache
+            fake.reset()
+
+            async def one():
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post("/place-oco", json=payload)
+                    latencies.append(time.perf_counter() - started)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(args.requests)))
+            elapsed = time.perf_counter() - started
+            placement_calls = dict(fake.calls)
+
+            # Let fills, TPs and sibling cancels play out before counting
+            await asyncio.sleep(args.settle)
+            total_calls = dict(fake.calls)
+
+    await fake.stop()
+
+    brackets = statuses.get(200, 0)
+    per_bracket = (lambda calls: round(sum(calls.values()) / brackets, 2) if brackets else None)
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ok": brackets,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "throughput": round(args.requests / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        "calls_per_bracket": per_bracket(placement_calls),
+        "calls_per_bracket_settled": per_bracket(total_calls),
+        "calls": total_calls,
+    }
+
+def print_report(report):
+    print(f"\n--- /place-oco x{report['requests']} @ concurrency {report['concurrency']} ---")
+    print(f"OK: {report['ok']}  statuses: {report['statuses']}")
+    print(f"Throughput: {report['throughput']} req/s over {report['seconds']} s")
+    print(f"Latency ms: p50 {report['p50_ms']}  p99 {report['p99_ms']}  mean {report['mean_ms']}  max {report['max_ms']}")
+    print(f"Gateway calls per bracket: {report['calls_per_bracket']} placing, {report['calls_per_bracket_settled']} incl. follow-up")
+    for path, count in sorted(report["calls"].items()):
+        print(f"  {path}: {count}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /place-oco against a fake gateway")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every gateway call")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--lost-ack-rate", type=float, default=0.0)
+    parser.add_argument("--fill-after", type=float, default=None, help="seconds until entries fill")
+    parser.add_argument("--exit-after", type=float, default=None, help="seconds from entry fill to stop fill")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to keep counting calls afterwards")
+    parser.add_argument("--bracket-mode", default="client", choices=["client", "native", "auto"])
+    parser.add_argument("--rate-limits", action="store_true", help="keep the production rate limits")
+    parser.add_argument("--symbol", default="MNQ")
+    parser.add_argument("--op", type=float, default=100.0)
+    parser.add_argument("--tp", type=float, default=110.0)
+    parser.add_argument("--sl", type=float, default=95.0)
+    parser.add_argument("--balance", type=float, default=1e9, help="fake account balance (maximumLoss is 0)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    # Rejections are fast; a run that mostly measured them measured nothing
+    if report["ok"] < report["requests"] / 2:
+        sys.exit(f"Only {report['ok']} of {report['requests']} requests returned 200: {report['statuses']}")
+
+if __name__ == "__main__":
+    main()
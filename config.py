@@ -4,7 +4,10 @@ import sys;sys.path.append(os.path.relpath(rootPath, os.path.dirname(__file__)))
 import yaml
 import logging
 
-def load_credentials(key='discord', filepath=f'{rootPath}/config.yaml'):
+# TSX_CONFIG points the server and its modules at another config file
+CONFIG_PATH = os.environ.get("TSX_CONFIG", f"{rootPath}/config.yaml")
+
+def load_credentials(key='discord', filepath=CONFIG_PATH):
     try:
         with open(filepath, 'r') as file:
             credentials = yaml.safe_load(file)
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+
+class AccountCache(object):
+    """
+    In-memory snapshot of the trading account (balance, maximumLoss, ...).
+
+    `fetch` is a coroutine function returning the account dict or None.
+    A background task refreshes the snapshot every `refresh_interval`
+    seconds; readers get the cached copy as long as it is younger than
+    `max_staleness` and only hit the network when it isn't. Call
+    invalidate() after a fill or cancel to force a prompt refresh.
+    Subscribed handlers are called with (old, new) snapshots whenever a
+    refresh brings back different data.
+    """
+    def __init__(self, fetch, refresh_interval=5.0, max_staleness=15.0):
+        self._fetch = fetch
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.snapshot = None
+        self.fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._handlers = []
+
+    def subscribe(self, handler):
+        self._handlers.append(handler)
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def _fresh_snapshot(self):
+        if self.snapshot is not None and self.age() <= self.max_staleness:
+            return self.snapshot
+        return None
+
+    async def get(self):
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot
+        return await self.refresh()
+
+    async def refresh(self):
+        if self._lock.locked():
+            # A refresh is already in flight, share its result
+            async with self._lock:
+                return self._fresh_snapshot()
+
+        async with self._lock:
+            snapshot = await self._fetch()
+            if snapshot:
+                previous, self.snapshot = self.snapshot, snapshot
+                self.fetched_at = time.monotonic()
+                if snapshot != previous:
+                    for handler in self._handlers:
+                        try:
+                            handler(previous, snapshot)
+                        except Exception as e:
+                            logging.error(f"Account change handler error: {e}")
+            return self._fresh_snapshot()
+
+    def invalidate(self):
+        """Mark the snapshot stale and wake the refresher."""
+        self.fetched_at = 0.0
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Account refresh error: {e}")
@@ -0,0 +1,22 @@
+class AccountSession(object):
+    """
+    Everything the server keeps per TopstepX account: live OCO groups,
+    the order history index, the fill watcher and the order pipeline.
+
+    Sessions share the process-wide gateway connection pool, session
+    token, contract map and account snapshot cache; only order state is
+    account scoped.
+    """
+    def __init__(self, account_id, oco_store, order_history, fill_watcher, order_pipeline):
+        self.account_id = account_id
+        self.oco_store = oco_store
+        self.order_history = order_history
+        self.fill_watcher = fill_watcher
+        self.order_pipeline = order_pipeline
+
+    def __repr__(self):
+        return f"AccountSession({self.account_id}, {len(self.oco_orders)} OCO groups)"
+
+    @property
+    def oco_orders(self):
+        return self.oco_store.groups  # entry_id: [tp_id, sl_id]
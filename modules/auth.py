@@ -0,0 +1,76 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+
+def jwt_expiry(token):
+    """
+    Return the `exp` claim of a JWT as a unix timestamp, or None if the
+    token isn't a JWT or carries no expiry.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        exp = claims.get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+class TokenManager(object):
+    """
+    Caches the gateway session token and refreshes it before it expires.
+
+    `login` is a coroutine function returning a new token or None. The
+    expiry comes from the JWT `exp` claim, falling back to issue time + ttl.
+    Concurrent callers share a single in-flight refresh, and a token is
+    only dropped early when the gateway rejects it with a 401.
+    """
+    def __init__(self, login, ttl=23 * 3600, refresh_margin=600):
+        self._login = login
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    async def get(self):
+        if self._is_fresh():
+            return self._token
+        return await self.refresh()
+
+    async def refresh(self, force=False):
+        stale = self._token
+        async with self._lock:
+            # Another caller may have refreshed while we waited on the lock
+            if self._token is not None and (self._token != stale or (not force and self._is_fresh())):
+                return self._token
+
+            token = await self._login()
+            if not token:
+                return None
+
+            self._token = token
+            self._expires_at = jwt_expiry(token) or (time.time() + self.ttl)
+            logging.info("Session token refreshed")
+            return token
+
+    def invalidate(self, token):
+        """Drop `token` if it is still the cached one (called on a 401)."""
+        if token and token == self._token:
+            logging.info("Session token rejected, will re-authenticate")
+            self._token = None
+            self._expires_at = 0.0
+
+    async def run(self):
+        """Background task: refresh ahead of expiry so callers never wait on login."""
+        while True:
+            delay = self._expires_at - self.refresh_margin - time.time()
+            if self._token is None or delay <= 0:
+                token = await self.refresh(force=True)
+                delay = 30 if not token else self._expires_at - self.refresh_margin - time.time()
+            await asyncio.sleep(max(delay, 1))
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import logging
+import os
+
+CACHE_VERSION = 1
+
+def contracts_digest(contracts):
+    return hashlib.sha1(json.dumps(contracts, sort_keys=True).encode()).hexdigest()
+
+class ContractCache(object):
+    """
+    Versioned on-disk copy of the UserContract list.
+
+    Lets the server build its contract map at boot without waiting on
+    the network. Keeps the ETag / Last-Modified of the last download for
+    conditional refreshes, and a digest of the payload so an unchanged
+    list can be skipped even when the server ignores those headers.
+    Writes go to a temp file that is renamed over the old one.
+    """
+    def __init__(self, path="state/contracts.json"):
+        self.path = path
+        self.etag = None
+        self.last_modified = None
+        self.digest = None
+
+    def load(self):
+        """Return the cached contract list, or None if missing or outdated."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable contract cache: {e}")
+            return None
+
+        if data.get("version") != CACHE_VERSION:
+            logging.info("Contract cache version changed, ignoring it")
+            return None
+        self.etag = data.get("etag")
+        self.last_modified = data.get("lastModified")
+        self.digest = data.get("digest")
+        return data.get("contracts")
+
+    def changed(self, contracts):
+        return contracts_digest(contracts) != self.digest
+
+    def save(self, contracts, etag=None, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = contracts_digest(contracts)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": CACHE_VERSION,
+                "etag": etag,
+                "lastModified": last_modified,
+                "digest": self.digest,
+                "contracts": contracts
+            }, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
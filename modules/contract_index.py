@@ -0,0 +1,123 @@
+import logging
+
+from modules.contract_spec import ContractSpec
+
+# Exchange product codes whose trading symbol differs ("F.US.ENQ" trades as NQ)
+SYMBOL_ALIASES = {"ENQ": "NQ", "EP": "ES", "GCE": "GC"}
+
+MONTH_CODES = "FGHJKMNQUVXZ"
+
+def short_symbol(product_id, aliases=SYMBOL_ALIASES):
+    parts = (product_id or "").split(".")
+    if len(parts) < 3:
+        return None
+    return aliases.get(parts[-1], parts[-1])
+
+def contract_month(contract_id):
+    """(year, month) from a contract id like "CON.F.US.MNQ.Z25", or None."""
+    code = (contract_id or "").rsplit(".", 1)[-1]
+    if len(code) < 2 or code[0] not in MONTH_CODES or not code[1:].isdigit():
+        return None
+    return 2000 + int(code[1:]), MONTH_CODES.index(code[0]) + 1
+
+class ContractIndex(object):
+    """
+    Read-only view of the active contract list, built once per refresh and
+    replaced as a whole, so a lookup never sees a half-built index.
+
+    Reads like the old {symbol: ContractSpec} dict (get, in, keys, items,
+    ...) and adds O(1) lookups by contractId and productId for the order
+    event and fill paths.
+
+    When a product lists several months, the one flagged activeContract
+    trades, else the nearest month. Specs of months that rolled off are
+    carried over from `previous` under their contractId, so live orders on
+    an old month still resolve; `rolls` lists what moved in this build.
+
+    Micro/standard pairs come from the data: "M" + a listed symbol whose
+    point value is larger, e.g. MNQ → NQ (2 vs 20).
+    """
+    def __init__(self, contracts=(), previous=None, aliases=SYMBOL_ALIASES):
+        candidates = {}
+        for c in contracts:
+            if c.get("disabled") or not c.get("contractId"):
+                continue
+            symbol = short_symbol(c.get("productId"), aliases)
+            if symbol:
+                candidates.setdefault(symbol, []).append(c)
+
+        self._by_symbol = {
+            symbol: ContractSpec(symbol, self._front_month(listed))
+            for symbol, listed in candidates.items()
+        }
+        self._by_product = {spec.productId: spec for spec in self._by_symbol.values()}
+        self._by_contract = {}
+        if previous is not None:
+            self._by_contract.update(previous._by_contract)
+        self._by_contract.update((spec.contractId, spec) for spec in self._by_symbol.values())
+
+        self._standard = {}
+        for symbol, micro in self._by_symbol.items():
+            standard = self._by_symbol.get(symbol[1:]) if symbol.startswith("M") else None
+            if standard is not None and standard.pointValue > micro.pointValue:
+                self._standard[symbol] = symbol[1:]
+
+        self.rolls = []  # (symbol, old contractId, new contractId)
+        if previous is not None:
+            for symbol, spec in self._by_symbol.items():
+                old = previous.get(symbol)
+                if old is not None and old.contractId != spec.contractId:
+                    self.rolls.append((symbol, old.contractId, spec.contractId))
+
+    @staticmethod
+    def _front_month(listed):
+        if len(listed) == 1:
+            return listed[0]
+        active = [c for c in listed if c.get("activeContract")]
+        if len(active) == 1:
+            return active[0]
+        dated = [c for c in listed if contract_month(c["contractId"])]
+        if not dated:
+            logging.warning(f"Can't tell the front month of {[c['contractId'] for c in listed]}, using the last")
+            return listed[-1]
+        return min(dated, key=lambda c: contract_month(c["contractId"]))
+
+    # --- Dict-style access by short symbol ---
+    def get(self, symbol, default=None):
+        return self._by_symbol.get(symbol, default)
+
+    def __getitem__(self, symbol):
+        return self._by_symbol[symbol]
+
+    def __contains__(self, symbol):
+        return symbol in self._by_symbol
+
+    def __len__(self):
+        return len(self._by_symbol)
+
+    def __iter__(self):
+        return iter(self._by_symbol)
+
+    def __bool__(self):
+        return bool(self._by_symbol)
+
+    def keys(self):
+        return self._by_symbol.keys()
+
+    def values(self):
+        return self._by_symbol.values()
+
+    def items(self):
+        return self._by_symbol.items()
+
+    # --- Reverse lookups ---
+    def by_contract_id(self, contract_id):
+        return self._by_contract.get(contract_id)
+
+    def by_product_id(self, product_id):
+        return self._by_product.get(product_id)
+
+    def standard_for(self, symbol):
+        """The full-size contract for a micro symbol, or None."""
+        standard = self._standard.get(symbol)
+        return self._by_symbol.get(standard) if standard else None
@@ -0,0 +1,89 @@
+from decimal import Decimal, ROUND_FLOOR
+
+try:
+    import numpy as np
+except ImportError:  # vectorized helpers are optional
+    np = None
+
+def get_precision(tick_size):
+    """
+    Returns the number of decimal places needed to represent tick_size cleanly.
+    Example:
+    0.1   → 1
+    0.25  → 2
+    0.01  → 2
+    0.0001 → 4
+    """
+    exponent = Decimal(str(tick_size)).normalize().as_tuple().exponent
+    return max(0, -exponent)
+
+class ContractSpec(object):
+    """
+    Contract metadata plus tick math precomputed once when contracts load.
+
+    Prices are converted with Decimal(str(price)), i.e. exactly as written,
+    so a price already on a tick always stays on that tick. Internally
+    prices are integer multiples of 10**-precision ("units"), and a tick
+    is `tick_units` of them.
+    """
+    __slots__ = (
+        "symbol", "contractId", "productId", "tickValue", "tickSize", "pointValue",
+        "exchangeFee", "regulatoryFee", "totalFees", "decimalPlaces", "priceScale",
+        "precision", "scale", "tick", "tick_units"
+    )
+
+    FIELDS = (
+        "contractId", "tickValue", "tickSize", "pointValue", "exchangeFee",
+        "regulatoryFee", "totalFees", "decimalPlaces", "priceScale"
+    )
+
+    def __init__(self, symbol, contract):
+        self.symbol = symbol
+        self.productId = contract.get("productId")
+        for field in self.FIELDS:
+            setattr(self, field, contract[field])
+
+        self.tick = Decimal(str(self.tickSize))
+        self.precision = max(get_precision(self.tickSize), int(self.decimalPlaces or 0))
+        self.scale = 10 ** self.precision
+        self.tick_units = int(self.tick * self.scale)
+
+    def __repr__(self):
+        return f"ContractSpec({self.symbol}, {self.contractId}, tick={self.tickSize})"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    # --- Scalar helpers ---
+    def to_ticks(self, price):
+        """Whole ticks at or below `price`."""
+        return int((Decimal(str(price)) / self.tick).to_integral_value(rounding=ROUND_FLOOR))
+
+    def from_ticks(self, ticks):
+        return ticks * self.tick_units / self.scale
+
+    def round_to_tick(self, price):
+        """Floor `price` onto the tick grid."""
+        return self.from_ticks(self.to_ticks(price))
+
+    def add_ticks(self, price, ticks):
+        return self.from_ticks(self.to_ticks(price) + ticks)
+
+    def ticks_between(self, a, b):
+        return abs(self.to_ticks(a) - self.to_ticks(b))
+
+    # --- Vectorized helpers ---
+    def round_prices(self, prices):
+        """
+        Floor a whole array of prices onto the tick grid at once. A small
+        tolerance absorbs binary float error so on-tick prices stay put.
+        """
+        if np is None:
+            return [self.round_to_tick(p) for p in prices]
+        ticks = np.floor(np.asarray(prices, dtype=np.float64) / float(self.tick) + 1e-9)
+        return ticks.astype(np.int64) * self.tick_units / self.scale
+
+    def ticks_array(self, prices):
+        if np is None:
+            return [self.to_ticks(p) for p in prices]
+        return np.floor(np.asarray(prices, dtype=np.float64) / float(self.tick) + 1e-9).astype(np.int64)
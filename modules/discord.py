@@ -3,12 +3,20 @@ rootPath = Path(os.path.dirname(__file__)).parent
 import sys;sys.path.append(os.path.relpath(rootPath, os.path.dirname(__file__)))
 import requests
 import time
+import json
+import queue
+import atexit
+import logging
+import threading
 from config import load_credentials
 from threading import Timer
 
 WEBHOOK_URL = load_credentials('discord')
+MAX_CONTENT = 2000  # Discord's per-message content limit
 
 class RepeatedTimer(object):
+    daemon = False
+
     def __init__(self, interval, function, *args, **kwargs):
         self._timer     = None
         self.interval   = interval
@@ -26,6 +34,7 @@ class RepeatedTimer(object):
     def start(self):
         if not self.is_running:
             self._timer = Timer(self.interval, self._run)
+            self._timer.daemon = self.daemon
             self._timer.start()
             self.is_running = True
 
@@ -33,13 +42,127 @@ class RepeatedTimer(object):
         self._timer.cancel()
         self.is_running = False
 
-def Alert(message):
-    payload = {
-        "username": "TOPSTEPX",
-        "content": message
-    }
+class FlushTimer(RepeatedTimer):
+    daemon = True
+
+class AlertDispatcher(object):
+    """
+    Non-blocking webhook sender.
+
+    send() only enqueues and returns. A timer thread flushes the queue
+    every `interval` seconds, joining queued alerts into as few webhook
+    messages as fit in Discord's content limit. Rate limits (429 and the
+    X-RateLimit-* headers) and failed posts pause sending with backoff;
+    unsent messages are kept and retried. When the queue is full, new
+    alerts are appended to `spill_path` (or dropped if it is None).
+    """
+    def __init__(self, webhook_url, interval=1.0, max_queue=1000, spill_path=None, timeout=5):
+        self.webhook_url = webhook_url
+        self.interval = interval
+        self.spill_path = spill_path
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = []  # coalesced messages waiting to be posted
+        self._session = requests.Session()
+        self._flush_lock = threading.Lock()
+        self._blocked_until = 0.0
+        self._backoff = 1.0
+        self._timer = None
+
+    def send(self, message):
+        if not self.webhook_url:  # alerts disabled
+            return
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self._spill(message)
+        if self._timer is None:
+            self._timer = FlushTimer(self.interval, self.flush)
+
+    def _spill(self, message):
+        if not self.spill_path:
+            logging.warning("Alert queue full, dropping alert")
+            return
+        try:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, "a") as f:
+                f.write(json.dumps({"ts": time.time(), "content": message}) + "\n")
+        except OSError as e:
+            logging.error(f"Alert spill failed: {e}")
+
+    def _coalesce(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        chunk = ""
+        for message in messages:
+            message = message[:MAX_CONTENT]
+            if chunk and len(chunk) + 1 + len(message) > MAX_CONTENT:
+                self._pending.append(chunk)
+                chunk = ""
+            chunk = f"{chunk}\n{message}" if chunk else message
+        if chunk:
+            self._pending.append(chunk)
+        while len(self._pending) > self._queue.maxsize:
+            self._spill(self._pending.pop(0))
 
-    res = requests.post(WEBHOOK_URL, json=payload)
+    def _post(self, content):
+        """Post one message. Returns True when it was accepted."""
+        res = self._session.post(
+            self.webhook_url,
+            json={"username": "TOPSTEPX", "content": content},
+            timeout=self.timeout
+        )
+        if res.status_code == 429:
+            try:
+                retry_after = float(res.json().get("retry_after", 1))
+            except ValueError:
+                retry_after = float(res.headers.get("Retry-After", 1))
+            self._blocked_until = time.time() + retry_after
+            return False
+
+        res.raise_for_status()
+        if res.headers.get("X-RateLimit-Remaining") == "0":
+            reset_after = float(res.headers.get("X-RateLimit-Reset-After", 1))
+            self._blocked_until = time.time() + reset_after
+        return True
+
+    def flush(self):
+        # The timer can fire again while a slow flush is still running
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._coalesce()
+            while self._pending and time.time() >= self._blocked_until:
+                try:
+                    if not self._post(self._pending[0]):
+                        break
+                except Exception as e:
+                    logging.error(f"Discord alert failed: {e}")
+                    self._blocked_until = time.time() + self._backoff
+                    self._backoff = min(self._backoff * 2, 60)
+                    break
+                self._pending.pop(0)
+                self._backoff = 1.0
+        finally:
+            self._flush_lock.release()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        self.flush()
+
+dispatcher = AlertDispatcher(WEBHOOK_URL, spill_path=os.path.join(rootPath, "state", "discord_spill.jsonl"))
+atexit.register(dispatcher.stop)
+
+def Alert(message):
+    dispatcher.send(message)
 
 if __name__ == '__main__':
-    Alert("DISCORD TEST")
\ No newline at end of file
+    Alert("DISCORD TEST")
+    dispatcher.stop()
@@ -0,0 +1,68 @@
+import asyncio
+import itertools
+import json
+import time
+
+class Subscriber(object):
+    """One connected client: a bounded queue of messages plus what it lost."""
+    def __init__(self, max_queue):
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, message):
+        """Queue without waiting; a full queue gives up its oldest message. True if one was dropped."""
+        dropped = self.queue.full()
+        if dropped:
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+        return dropped
+
+class EventHub(object):
+    """
+    Fan-out of server events (order acks, fills, OCO changes, balances)
+    to every connected push client.
+
+    Each client gets its own queue of at most `max_queue` messages and
+    publish() never waits on any of them: a client that falls behind loses
+    its oldest messages, which it can tell from the gap in `seq`, and never
+    holds back the others or the order path.
+    """
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._seq = itertools.count(1)
+        self.dropped = 0  # over all clients, past and present
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = Subscriber(self.max_queue)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        """Number, timestamp and deliver a new event; returns the message."""
+        message = {"seq": next(self._seq), "event": event, "ts": time.time(), "data": data}
+        self.deliver(message)
+        return message
+
+    def deliver(self, message):
+        """Fan out an already numbered message, e.g. one relayed from another process."""
+        for subscriber in self._subscribers:
+            self.dropped += subscriber.offer(message)
+
+    def stats(self):
+        return {
+            "clients": len(self._subscribers),
+            "dropped": self.dropped,
+        }
+
+def sse(message):
+    """A message in text/event-stream framing; no id line when `seq` is None."""
+    head = "" if message.get("seq") is None else f"id: {message['seq']}\n"
+    return f"{head}event: {message['event']}\ndata: {json.dumps(message['data'], default=str)}\n\n".encode()
@@ -0,0 +1,319 @@
+import asyncio
+import datetime
+import itertools
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from modules.order_stream import ORDER_OPEN, ORDER_FILLED, ORDER_CANCELLED
+
+ORDER_TYPE_LIMIT = 1
+ORDER_TYPE_MARKET = 2
+ORDER_TYPE_STOP = 4
+
+DEFAULT_CONTRACTS = [
+    # productId, contractId, tickSize, tickValue, pointValue
+    ("F.US.MNQ", "CON.F.US.MNQ.Z25", 0.25, 0.5, 2),
+    ("F.US.ENQ", "CON.F.US.ENQ.Z25", 0.25, 5, 20),
+    ("F.US.MES", "CON.F.US.MES.Z25", 0.25, 1.25, 5),
+    ("F.US.EP", "CON.F.US.EP.Z25", 0.25, 12.5, 50),
+    ("F.US.MYM", "CON.F.US.MYM.Z25", 1, 0.5, 0.5),
+    ("F.US.YM", "CON.F.US.YM.Z25", 1, 5, 5),
+    ("F.US.MGC", "CON.F.US.MGC.Z25", 0.1, 1, 10),
+    ("F.US.GCE", "CON.F.US.GCE.Z25", 0.1, 10, 100),
+]
+
+def now_iso():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+class GatewayError(Exception):
+    """Non-2xx answer from the in-process gateway, like aiohttp's ClientResponseError."""
+    def __init__(self, status, message):
+        super(GatewayError, self).__init__(f"{status}, message='{message}'")
+        self.status = status
+
+class FakeGateway(object):
+    """
+    Local stand-in for api.topstepx.com and userapi.topstepx.com, covering
+    the endpoints the server uses. Serve it over HTTP with start() (one
+    port per host, so the server treats them as two hosts exactly as in
+    production) or call it in-process through InProcessGateway.
+
+    Knobs:
+    - latency / jitter: seconds added to every call; `latency` may also be
+      a {path: seconds} dict
+    - fail_rate: share of calls answered with HTTP 500
+    - lost_ack_rate: share of placements that create the order but answer
+      504, i.e. an order whose outcome the client can't know
+    - fill_after: seconds after which open entries fill at their price
+      (None: never); market orders fill at once
+    - exit_after: seconds after an entry fill at which its protective
+      stop fills (None: never)
+    - native_brackets: accept stopLossBracket/takeProfitBracket or reject
+      them like an account without brackets enabled
+
+    Prices fed through set_price() fill resting orders they cross; legs
+    linked to an entry only work once that entry has filled. `on_order`,
+    if set, is called with every order whose status changes, the way the
+    user hub pushes updates. `calls` counts requests per path. Time-based
+    fills are simulated lazily from `clock` whenever a request arrives.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, fail_rate=0.0, lost_ack_rate=0.0,
+                 fill_after=None, exit_after=None, native_brackets=True, accounts=None,
+                 contracts=None, seed=0, clock=time.monotonic):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.lost_ack_rate = lost_ack_rate
+        self.fill_after = fill_after
+        self.exit_after = exit_after
+        self.native_brackets = native_brackets
+        self.accounts = accounts or [{"accountId": 1, "balance": 52000.0, "maximumLoss": 50000.0}]
+        self.contracts = contracts or [
+            {
+                "productId": product_id, "contractId": contract_id, "tickSize": tick_size,
+                "tickValue": tick_value, "pointValue": point_value, "exchangeFee": 0.35,
+                "regulatoryFee": 0.02, "totalFees": 0.37, "decimalPlaces": 2, "priceScale": 100
+            }
+            for product_id, contract_id, tick_size, tick_value, point_value in DEFAULT_CONTRACTS
+        ]
+        self.orders = {}
+        self.prices = {}  # contract_id → last price
+        self.calls = Counter()
+        self.on_order = None
+        self.api_url = None
+        self.user_api_url = None
+        self._clock = clock
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1000)
+        self._filled_at = {}  # order id → clock time of the fill
+        self._runners = []
+
+    def reset(self):
+        self.calls.clear()
+
+    # --- Simulation ---
+    def delay(self, path):
+        latency = self.latency.get(path, 0.0) if isinstance(self.latency, dict) else self.latency
+        return latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def failed(self):
+        return bool(self.fail_rate) and self._random.random() < self.fail_rate
+
+    def _set_status(self, order, status, price=None):
+        order["status"] = status
+        order["updateTimestamp"] = now_iso()
+        if status == ORDER_FILLED:
+            order["filledPrice"] = price
+            self._filled_at[order["id"]] = self._clock()
+        if self.on_order:
+            self.on_order(self._public(order))
+
+    def _working(self, order):
+        """Open, and not a leg still waiting for its entry to fill."""
+        if order["status"] != ORDER_OPEN:
+            return False
+        entry_id = order.get("linkedOrderId")
+        return entry_id is None or entry_id in self._filled_at
+
+    def _crossed(self, order, price):
+        buy = order.get("side") == 0
+        if order.get("type") == ORDER_TYPE_LIMIT:
+            limit = order.get("limitPrice")
+            return limit is not None and (price <= limit if buy else price >= limit)
+        if order.get("type") == ORDER_TYPE_STOP:
+            stop = order.get("stopPrice")
+            return stop is not None and (price >= stop if buy else price <= stop)
+        return order.get("type") == ORDER_TYPE_MARKET
+
+    def set_price(self, contract_id, price):
+        """Move the market; fills every working order the price reaches."""
+        self.prices[contract_id] = price
+        filled = True
+        while filled:  # an entry fill can arm legs the same price triggers
+            filled = False
+            for order in list(self.orders.values()):
+                if order.get("contractId") == contract_id and self._working(order) and self._crossed(order, price):
+                    fill_price = order.get("limitPrice") if order.get("type") == ORDER_TYPE_LIMIT else order.get("stopPrice")
+                    self._set_status(order, ORDER_FILLED, price if fill_price is None else fill_price)
+                    filled = True
+
+    def fill(self, order_id, price=None):
+        """Fill a working order now, e.g. at a recorded fill price. False if it can't fill."""
+        order = self.orders.get(order_id)
+        if order is None or not self._working(order):
+            return False
+        if price is None:
+            price = order.get("limitPrice") or order.get("stopPrice")
+        self._set_status(order, ORDER_FILLED, price)
+        return True
+
+    def advance(self):
+        now = self._clock()
+        for order in list(self.orders.values()):
+            if order["status"] != ORDER_OPEN:
+                continue
+            entry_id = order.get("linkedOrderId")
+            if entry_id is None:
+                if self.fill_after is not None and now - order["_created"] >= self.fill_after:
+                    self._set_status(order, ORDER_FILLED, order.get("limitPrice") or order.get("stopPrice"))
+            elif order.get("stopPrice") is not None and self.exit_after is not None:
+                filled_at = self._filled_at.get(entry_id)
+                if filled_at is not None and now - filled_at >= self.exit_after:
+                    self._set_status(order, ORDER_FILLED, order["stopPrice"])
+
+    def _public(self, order):
+        return {k: v for k, v in order.items() if not k.startswith("_")}
+
+    # --- Endpoints: data in, (status, body) out ---
+    def handle(self, path, data=None):
+        handler = self._routes().get(path)
+        if handler is None:
+            return 404, {"success": False, "errorMessage": "not found"}
+        self.calls[path] += 1
+        if self.failed():
+            return 500, {"success": False, "errorMessage": "injected failure"}
+        self.advance()
+        return handler(data or {})
+
+    def _routes(self):
+        return {
+            "/api/Auth/loginKey": self._login,
+            "/api/Order/place": self._place,
+            "/api/Order/cancel": self._cancel,
+            "/api/Order/search": self._search,
+            "/api/Order/searchOpen": self._search_open,
+            "/TradingAccount": self._trading_account,
+            "/UserContract/active/nonprofesional": self._contracts,
+        }
+
+    def _login(self, data):
+        return 200, {"success": True, "token": "fake-token", "errorCode": 0}
+
+    def _place(self, data):
+        if not self.native_brackets and ("stopLossBracket" in data or "takeProfitBracket" in data):
+            return 200, {"success": False, "errorCode": 2, "errorMessage": "Brackets are not enabled for this account"}
+
+        order_id = next(self._ids)
+        order = dict(data, id=order_id, status=ORDER_OPEN, creationTimestamp=now_iso(), _created=self._clock())
+        self.orders[order_id] = order
+        price = self.prices.get(data.get("contractId"))
+        if data.get("type") == ORDER_TYPE_MARKET:
+            self._set_status(order, ORDER_FILLED, price if price is not None else data.get("limitPrice") or 0.0)
+        elif price is not None and self._working(order) and self._crossed(order, price):
+            self._set_status(order, ORDER_FILLED, price)
+
+        if self.lost_ack_rate and self._random.random() < self.lost_ack_rate:
+            return 504, {"success": False, "errorMessage": "gateway timeout"}
+        return 200, {"success": True, "orderId": order_id, "errorCode": 0}
+
+    def _cancel(self, data):
+        order = self.orders.get(data.get("orderId"))
+        if order is None or order["status"] != ORDER_OPEN:
+            return 200, {"success": False, "errorCode": 1, "errorMessage": "Order not open"}
+        self._set_status(order, ORDER_CANCELLED)
+        return 200, {"success": True, "errorCode": 0}
+
+    def _account_orders(self, data):
+        return [o for o in self.orders.values() if o.get("accountId") == data.get("accountId")]
+
+    def _search(self, data):
+        return 200, {"success": True, "orders": [self._public(o) for o in self._account_orders(data)]}
+
+    def _search_open(self, data):
+        orders = [self._public(o) for o in self._account_orders(data) if o["status"] == ORDER_OPEN]
+        return 200, {"success": True, "orders": orders}
+
+    def _trading_account(self, data):
+        return 200, self.accounts
+
+    def _contracts(self, data):
+        return 200, self.contracts
+
+    # --- HTTP ---
+    async def _http(self, request):
+        data = await request.json() if request.method == "POST" else None
+        delay = self.delay(request.path)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        status, body = self.handle(request.path, data)
+        return web.json_response(body, status=status)
+
+    def make_app(self):
+        app = web.Application()
+        for path in self._routes():
+            method = "POST" if path.startswith("/api/") else "GET"
+            app.router.add_route(method, path, self._http)
+        return app
+
+    async def start(self, host="127.0.0.1", api_port=0, user_api_port=0):
+        """Serve both hosts; sets and returns (api_url, user_api_url)."""
+        urls = []
+        for port in (api_port, user_api_port):
+            runner = web.AppRunner(self.make_app(), access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, host, port)
+            await site.start()
+            self._runners.append(runner)
+            bound_port = runner.addresses[0][1]
+            urls.append(f"http://{host}:{bound_port}")
+        self.api_url, self.user_api_url = urls
+        return self.api_url, self.user_api_url
+
+    async def stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners = []
+
+class InProcessGateway(object):
+    """
+    Drop-in for modules.gateway.Gateway that calls a FakeGateway directly,
+    no sockets involved. Latency is an asyncio.sleep, so on a virtual
+    clock loop it costs no real time.
+    """
+    def __init__(self, fake):
+        self.fake = fake
+        self.scheduler = None
+        self.journal = None
+
+    async def request(self, method, base_url, path, token=None, json=None, headers=None, timeout=None, priority=None):
+        delay = self.fake.delay(path)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        status, body = self.fake.handle(path, json)
+        if self.journal is not None and path in ("/api/Order/place", "/api/Order/cancel", "/api/Order/modify"):
+            self.journal.record("gateway", endpoint=path, request=json, response=body, status=status)
+        if status >= 400:
+            raise GatewayError(status, body.get("errorMessage", ""))
+        return body
+
+    async def post(self, path, payload, token=None, timeout=None, priority=None):
+        return await self.request("POST", None, path, token=token, json=payload)
+
+    async def get_user(self, path, token=None, timeout=None, priority=None):
+        return await self.request("GET", None, path, token=token)
+
+    async def get_user_if_modified(self, path, token=None, etag=None, last_modified=None, timeout=None, priority=None):
+        return await self.request("GET", None, path, token=token), None, None
+
+    async def close(self):
+        pass
+
+async def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the fake TopstepX gateway")
+    parser.add_argument("--api-port", type=int, default=8765)
+    parser.add_argument("--user-api-port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fill-after", type=float, default=None)
+    args = parser.parse_args()
+
+    fake = FakeGateway(latency=args.latency, fill_after=args.fill_after)
+    api_url, user_api_url = await fake.start(api_port=args.api_port, user_api_port=args.user_api_port)
+    print(f"api_url: \"{api_url}\"\nuser_api_url: \"{user_api_url}\"")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
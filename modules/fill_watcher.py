@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from modules.order_stream import ORDER_FILLED, TERMINAL_STATUSES
+from modules.metrics import registry
+
+POLLS = registry.counter("tsx_fill_watcher_polls_total", "Order fetches made to resolve pending fills")
+
+def is_filled(order):
+    return order.get("status") == ORDER_FILLED or order.get("filledPrice") is not None
+
+class FillWatcher(object):
+    """
+    Waits for many orders to fill using one shared order fetch per cycle.
+
+    `fetch_orders` is a coroutine function taking the watched order ids and
+    returning {id: order} (or None on error). Each cycle fetches once and
+    resolves every waiter from that single response, so the number of API
+    calls doesn't grow with the number of pending entries.
+
+    wait() resolves with the order once it fills, or with None when the
+    order ends unfilled or is forgotten. A fetch only judges the ids it
+    asked for; an order it doesn't return is retried on later cycles, since
+    a just-placed order can lag behind the search, and only given up on
+    after `not_found_grace` seconds. While `is_streaming()` is true,
+    results come from on_order_update() and polling pauses.
+    """
+    def __init__(self, fetch_orders, interval=0.3, is_streaming=None, not_found_grace=30.0, clock=time.monotonic):
+        self._fetch = fetch_orders
+        self.interval = interval
+        self._is_streaming = is_streaming or (lambda: False)
+        self.not_found_grace = not_found_grace
+        self._clock = clock
+        self._waiters = {}  # order_id: Future
+        self._found = {}  # order_id: last time a fetch returned it, or when watching started
+        self._wake = asyncio.Event()
+        self._resync = False
+
+    def watch(self, order_id):
+        future = self._waiters.get(order_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[order_id] = future
+            self._found[order_id] = self._clock()
+            # The fill may have streamed in before we started watching
+            self._resync = True
+            self._wake.set()
+        return future
+
+    async def wait(self, order_id):
+        return await asyncio.shield(self.watch(order_id))
+
+    def _resolve(self, order_id, order):
+        future = self._waiters.pop(order_id, None)
+        self._found.pop(order_id, None)
+        if future is not None and not future.done():
+            future.set_result(order)
+
+    def forget(self, order_id):
+        """Stop waiting on `order_id`; its waiter gets None."""
+        self._resolve(order_id, None)
+
+    def on_orders(self, by_id, order_ids=None):
+        """
+        Resolve waiters from one batch of order snapshots keyed by id.
+        `order_ids` are the ids the batch was fetched for (default: all
+        waiters); waiters added since are left for the next cycle.
+        """
+        now = self._clock()
+        for order_id in list(self._waiters if order_ids is None else order_ids):
+            if order_id not in self._waiters:
+                continue
+            order = by_id.get(order_id)
+            if order is None:
+                if now - self._found.get(order_id, now) >= self.not_found_grace:
+                    logging.warning(f"Order {order_id} not found in search for {self.not_found_grace}s, giving up")
+                    self._resolve(order_id, None)
+                continue
+            self._found[order_id] = now
+            if is_filled(order):
+                self._resolve(order_id, order)
+            elif order.get("status") in TERMINAL_STATUSES:
+                self._resolve(order_id, None)
+
+    async def on_order_update(self, order):
+        order_id = order.get("id")
+        if order_id not in self._waiters:
+            return
+        if is_filled(order):
+            self._resolve(order_id, order)
+        elif order.get("status") in TERMINAL_STATUSES:
+            self._resolve(order_id, None)
+
+    async def run(self):
+        was_streaming = False
+        while True:
+            if not self._waiters:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            # Catch up once whenever the stream (re)connects
+            streaming = self._is_streaming()
+            if streaming and not was_streaming:
+                self._resync = True
+            was_streaming = streaming
+
+            if streaming and not self._resync:
+                await asyncio.sleep(self.interval)
+                continue
+            self._resync = False
+
+            POLLS.inc()
+            order_ids = list(self._waiters)
+            orders = await self._fetch(order_ids)
+            if orders is not None:
+                self.on_orders(orders, order_ids)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,164 @@
+import time
+import aiohttp
+
+from modules.rate_limiter import endpoint_class, default_priority
+from modules.metrics import registry
+
+REQUEST_SECONDS = registry.histogram("tsx_gateway_request_seconds", "Gateway HTTP round trip, after rate limiting", ("endpoint",))
+ERRORS = registry.counter("tsx_gateway_errors_total", "Gateway calls that failed or returned an error status", ("endpoint",))
+
+API_URL = "https://api.topstepx.com"
+USER_API_URL = "https://userapi.topstepx.com"
+
+USER_API_HEADERS = {
+    "Accept": "application/json",
+    "User-Agent": "Mozilla/5.0",
+    "x-app-type": "px-desktop",
+    "x-app-version": "1.21.1"
+}
+
+class Gateway(object):
+    """
+    Async HTTP client for the TopstepX gateway.
+
+    Keeps one keep-alive connection pool per host, so repeated calls reuse
+    open TLS connections instead of doing a new handshake every time.
+    Errors are raised to the caller, like requests' raise_for_status().
+
+    With a `scheduler` (RequestScheduler) every call first waits for its
+    rate limit buckets: the endpoint class plus "api" or "userapi" for the
+    host. `priority` defaults to the order lane for place/cancel/modify.
+
+    With a `journal` (TradeJournal) every order call (place, cancel,
+    modify) is recorded with its payload and the response or error.
+    """
+    def __init__(self, api_url=API_URL, user_api_url=USER_API_URL, timeout=10, pool_size=20, scheduler=None, journal=None):
+        self.api_url = api_url
+        self.user_api_url = user_api_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.scheduler = scheduler
+        self.journal = journal
+        self._sessions = {}
+
+    def _buckets(self, base_url, path):
+        if base_url == self.user_api_url:
+            return ("userapi",)
+        return (endpoint_class(path), "api")
+
+    async def _admit(self, base_url, path, priority):
+        buckets = self._buckets(base_url, path)
+        if self.scheduler is not None:
+            await self.scheduler.acquire(buckets, default_priority(path) if priority is None else priority)
+        return buckets
+
+    def _check_throttled(self, res, buckets):
+        if res.status == 429 and self.scheduler is not None:
+            try:
+                retry_after = float(res.headers.get("Retry-After", 1))
+            except ValueError:
+                retry_after = 1.0
+            self.scheduler.throttled(buckets, retry_after)
+
+    def _session(self, base_url):
+        session = self._sessions.get(base_url)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=60,
+                ssl=False
+            )
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[base_url] = session
+        return session
+
+    async def request(self, method, base_url, path, token=None, json=None, headers=None, timeout=None, priority=None):
+        buckets = await self._admit(base_url, path, priority)
+        all_headers = dict(headers or {})
+        if token:
+            all_headers["Authorization"] = f"Bearer {token}"
+        session = self._session(base_url)
+        journaled = self.journal is not None and buckets[0] == "orders"
+        started = time.perf_counter()
+        try:
+            async with session.request(
+                method,
+                f"{base_url}{path}",
+                json=json,
+                headers=all_headers,
+                timeout=aiohttp.ClientTimeout(total=timeout or self.timeout)
+            ) as res:
+                self._check_throttled(res, buckets)
+                res.raise_for_status()
+                body = await res.json(content_type=None)
+        except Exception as e:
+            ERRORS.inc(path)
+            if journaled:
+                self.journal.record("gateway", endpoint=path, request=json, error=str(e),
+                                    elapsedMs=round((time.perf_counter() - started) * 1000, 2))
+            raise
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, path)
+        if journaled:
+            self.journal.record("gateway", endpoint=path, request=json, response=body,
+                                elapsedMs=round((time.perf_counter() - started) * 1000, 2))
+        return body
+
+    async def post(self, path, payload, token=None, timeout=None, priority=None):
+        """POST JSON to api.topstepx.com and return the decoded body."""
+        return await self.request(
+            "POST", self.api_url, path,
+            token=token,
+            json=payload,
+            headers={"Content-Type": "application/json"},
+            timeout=timeout,
+            priority=priority
+        )
+
+    async def get_user(self, path, token=None, timeout=None, priority=None):
+        """GET from userapi.topstepx.com and return the decoded body."""
+        return await self.request(
+            "GET", self.user_api_url, path,
+            token=token,
+            headers=USER_API_HEADERS,
+            timeout=timeout,
+            priority=priority
+        )
+
+    async def get_user_if_modified(self, path, token=None, etag=None, last_modified=None, timeout=None, priority=None):
+        """
+        Conditional GET from userapi.topstepx.com. Returns
+        (body, etag, last_modified), with body None on 304 Not Modified.
+        """
+        buckets = await self._admit(self.user_api_url, path, priority)
+        headers = dict(USER_API_HEADERS)
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        session = self._session(self.user_api_url)
+        started = time.perf_counter()
+        try:
+            async with session.get(
+                f"{self.user_api_url}{path}",
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=timeout or self.timeout)
+            ) as res:
+                if res.status == 304:
+                    return None, etag, last_modified
+                self._check_throttled(res, buckets)
+                res.raise_for_status()
+                body = await res.json(content_type=None)
+                return body, res.headers.get("ETag"), res.headers.get("Last-Modified")
+        except Exception:
+            ERRORS.inc(path)
+            raise
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, path)
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions = {}
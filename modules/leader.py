@@ -0,0 +1,178 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+
+class LeaderLock(object):
+    """
+    Local leader election through an exclusive flock on `path`. Whoever
+    holds the lock leads; the kernel drops it when that process exits,
+    however it exits, so a follower's next try_acquire() takes over.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+class LeaderServer(object):
+    """
+    The leader's end of the worker IPC channel: JSON lines over a Unix
+    socket. A request is {"id", "op", "args"}; `handlers` maps op names to
+    coroutine functions taking the args as keywords. The reply is
+    {"id", "result"} or {"id", "error"}. broadcast() sends {"push"} to
+    every connected worker.
+    """
+    def __init__(self, path, handlers):
+        self.path = path
+        self.handlers = handlers
+        self._server = None
+        self._writers = set()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by a leader that died
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def broadcast(self, message):
+        line = (json.dumps({"push": message}, default=str) + "\n").encode()
+        for writer in list(self._writers):
+            if writer.is_closing():
+                self._writers.discard(writer)
+            else:
+                writer.write(line)
+
+    async def _serve(self, reader, writer):
+        pending = set()
+        self._writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # Requests on one connection run concurrently, like HTTP/2 streams
+                task = asyncio.create_task(self._answer(json.loads(line), writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (ConnectionError, ValueError) as e:
+            logging.warning(f"Worker connection dropped: {e}")
+        finally:
+            self._writers.discard(writer)
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+    async def _answer(self, message, writer):
+        handler = self.handlers.get(message.get("op"))
+        try:
+            if handler is None:
+                raise ValueError(f"unknown op {message.get('op')}")
+            reply = {"id": message.get("id"), "result": await handler(**message.get("args", {}))}
+        except Exception as e:
+            reply = {"id": message.get("id"), "error": str(e)}
+        writer.write((json.dumps(reply, default=str) + "\n").encode())
+        await writer.drain()
+
+class LeaderClient(object):
+    """
+    A follower's end of the channel: one persistent connection shared by
+    all callers, replies matched to requests by id. A broken connection
+    fails every pending call with ConnectionError and is reopened by the
+    next call, which finds whichever worker leads by then. Pushed messages
+    go to `on_push`.
+    """
+    def __init__(self, path, timeout=5, on_push=None):
+        self.path = path
+        self.timeout = timeout
+        self.on_push = on_push
+        self._ids = itertools.count(1)
+        self._pending = {}  # id → Future
+        self._writer = None
+        self._reader_task = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._lock:
+            if self._writer is None:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                self._reader_task = asyncio.create_task(self._read(reader))
+        return self._writer
+
+    async def _read(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                if "push" in reply:
+                    if self.on_push is not None:
+                        self.on_push(reply["push"])
+                    continue
+                future = self._pending.pop(reply.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        finally:
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("leader connection closed"))
+            self._pending.clear()
+
+    async def call(self, op, timeout=None, **args):
+        writer = await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            writer.write((json.dumps({"id": request_id, "op": op, "args": args}, default=str) + "\n").encode())
+            await writer.drain()
+            reply = await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+        if "error" in reply:
+            raise RuntimeError(f"leader {op}: {reply['error']}")
+        return reply.get("result")
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
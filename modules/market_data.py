@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from modules.order_stream import UserHub, RTC_URL, unwrap_event
+
+# Gateway order types
+ORDER_TYPE_LIMIT = 1
+ORDER_TYPE_MARKET = 2
+ORDER_TYPE_STOP = 4
+
+class Quote(object):
+    """One top-of-book update. `received` is the local monotonic time."""
+    __slots__ = ("contract_id", "bid", "ask", "last", "timestamp", "received")
+
+    def __init__(self, contract_id, bid, ask, last, timestamp=None, received=None):
+        self.contract_id = contract_id
+        self.bid = bid
+        self.ask = ask
+        self.last = last
+        self.timestamp = timestamp
+        self.received = time.monotonic() if received is None else received
+
+    def __repr__(self):
+        return f"Quote({self.contract_id}, bid={self.bid}, ask={self.ask}, last={self.last})"
+
+    @property
+    def crossed(self):
+        return self.bid is not None and self.ask is not None and self.bid > self.ask
+
+    @property
+    def price(self):
+        """Last trade, or the mid when no trade has been seen yet."""
+        if self.last is not None:
+            return self.last
+        if self.bid is not None and self.ask is not None:
+            return (self.bid + self.ask) / 2
+        return None
+
+class QuoteCache(object):
+    """
+    Last `depth` quotes per contract in a ring buffer (a bounded deque per
+    contract id), so the latest quote is an O(1) lookup and a short
+    history is kept for free. Gateway quote events may carry only the
+    fields that changed; update() fills the rest from the previous quote.
+
+    fresh() only returns a quote younger than `max_age` seconds that isn't
+    crossed, i.e. one that is safe to validate orders against.
+    """
+    def __init__(self, depth=64, max_age=5.0, clock=time.monotonic):
+        self.depth = depth
+        self.max_age = max_age
+        self._clock = clock
+        self._quotes = {}
+
+    def update(self, contract_id, data):
+        ring = self._quotes.get(contract_id)
+        if ring is None:
+            ring = self._quotes[contract_id] = deque(maxlen=self.depth)
+        previous = ring[-1] if ring else None
+
+        def field(key, attr):
+            if data.get(key) is not None:
+                return data[key]
+            return getattr(previous, attr) if previous else None
+
+        quote = Quote(
+            contract_id,
+            field("bestBid", "bid"),
+            field("bestAsk", "ask"),
+            field("lastPrice", "last"),
+            timestamp=data.get("timestamp") or data.get("lastUpdated"),
+            received=self._clock()
+        )
+        ring.append(quote)
+        return quote
+
+    def latest(self, contract_id):
+        ring = self._quotes.get(contract_id)
+        return ring[-1] if ring else None
+
+    def history(self, contract_id):
+        return list(self._quotes.get(contract_id, ()))
+
+    def age(self, contract_id):
+        quote = self.latest(contract_id)
+        return None if quote is None else self._clock() - quote.received
+
+    def fresh(self, contract_id):
+        quote = self.latest(contract_id)
+        if quote is None or quote.crossed or self._clock() - quote.received > self.max_age:
+            return None
+        return quote
+
+class MarketHub(UserHub):
+    """
+    SignalR client for the gateway market hub. Streams GatewayQuote events
+    for every watched contract to `on_quote(contract_id, data)`; contracts
+    can be added at any time and are resubscribed after a reconnect.
+    """
+    hub = "market"
+
+    def __init__(self, get_token, contract_ids=(), rtc_url=RTC_URL, ping_interval=15):
+        super(MarketHub, self).__init__(get_token, [], rtc_url=rtc_url, ping_interval=ping_interval)
+        self.contract_ids = set(contract_ids)
+        self.on_quote = None
+
+    def watch(self, contract_id):
+        if contract_id in self.contract_ids:
+            return
+        self.contract_ids.add(contract_id)
+        if self._ws is not None:
+            asyncio.create_task(self._invoke(self._ws, "SubscribeContractQuotes", contract_id))
+
+    async def _subscribe(self, ws):
+        for contract_id in list(self.contract_ids):
+            await self._invoke(ws, "SubscribeContractQuotes", contract_id)
+
+    async def _handle(self, message):
+        if message.get("type") == 7:
+            raise ConnectionError(message.get("error") or "hub closed the connection")
+        if message.get("type") != 1 or message.get("target") != "GatewayQuote":
+            return
+        args = message.get("arguments", [])
+        if len(args) >= 2 and self.on_quote:
+            await self.on_quote(args[0], unwrap_event(args[1]))
+
+class FakeQuoteFeed(object):
+    """
+    In-process stand-in for MarketHub. push() delivers a quote like the
+    real hub; replay() plays back recorded events, e.g. from load(), with
+    their original spacing divided by `speed`.
+    """
+    def __init__(self):
+        self.on_quote = None
+        self.connected = True
+        self.contract_ids = set()
+        self._queue = asyncio.Queue()
+
+    def watch(self, contract_id):
+        self.contract_ids.add(contract_id)
+
+    def push(self, contract_id, data):
+        self._queue.put_nowait((contract_id, data))
+
+    @staticmethod
+    def load(path):
+        """Read a JSONL capture of {"t": seconds, "contractId": ..., "quote": {...}} lines."""
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    async def replay(self, events, speed=1.0):
+        previous = None
+        for event in events:
+            t = event.get("t", 0)
+            if previous is not None and speed:
+                await asyncio.sleep(max(0.0, t - previous) / speed)
+            previous = t
+            self.push(event["contractId"], event["quote"])
+
+    async def run(self):
+        while True:
+            contract_id, data = await self._queue.get()
+            if self.connected and self.on_quote:
+                await self.on_quote(contract_id, data)
+
+class MarketData(object):
+    """
+    Feeds quotes from a hub (MarketHub, FakeQuoteFeed, ...) into a
+    QuoteCache. With a `journal` (TradeJournal) every quote is also
+    recorded, so a session can be replayed against the same market.
+    """
+    def __init__(self, hub, cache=None, journal=None):
+        self.hub = hub
+        self.cache = cache or QuoteCache()
+        self.journal = journal
+        hub.on_quote = self._on_quote
+
+    @property
+    def connected(self):
+        return self.hub.connected
+
+    def watch(self, contract_id):
+        if contract_id:
+            self.hub.watch(contract_id)
+
+    async def _on_quote(self, contract_id, data):
+        if self.journal is not None:
+            self.journal.record("quote", contractId=contract_id, quote=data)
+        try:
+            self.cache.update(contract_id, data)
+        except Exception as e:
+            logging.error(f"Bad quote for {contract_id}: {e}")
+
+    async def run(self):
+        await self.hub.run()
+
+# --- Order checks against the market ---
+def choose_entry_type(side, op, quote, entry_type):
+    """
+    A stop entry the market has already run through would be rejected;
+    rest it as a limit at `op` instead, which keeps the planned entry and
+    therefore the sized risk.
+    """
+    if entry_type != ORDER_TYPE_STOP or quote is None:
+        return entry_type
+    if side == 0 and quote.ask is not None and quote.ask >= op:
+        return ORDER_TYPE_LIMIT
+    if side == 1 and quote.bid is not None and quote.bid <= op:
+        return ORDER_TYPE_LIMIT
+    return entry_type
+
+def check_bracket(side, op, sl, quote, entry_type):
+    """
+    Why the protective stop would be rejected, or None. The stop is
+    linked to the entry (client mode) or set as an offset from the fill
+    (native mode), so it only goes live once the entry fills: it has to
+    be on the losing side of `op`. Only an entry that fills at once, a
+    limit at or through the market, puts the stop live against the
+    current market, so only then must it also be beyond the bid (long)
+    or the ask (short).
+    """
+    if side == 0 and sl >= op:
+        return f"SL {sl} is at or above the entry {op}"
+    if side == 1 and sl <= op:
+        return f"SL {sl} is at or below the entry {op}"
+    if quote is None or entry_type != ORDER_TYPE_LIMIT:
+        return None
+    if side == 0 and quote.ask is not None and op >= quote.ask and quote.bid is not None and sl >= quote.bid:
+        return f"SL {sl} is at or above the bid {quote.bid}"
+    if side == 1 and quote.bid is not None and op <= quote.bid and quote.ask is not None and sl <= quote.ask:
+        return f"SL {sl} is at or below the ask {quote.ask}"
+    return None
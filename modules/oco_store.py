@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+class OcoStore(object):
+    """
+    Crash-safe store for live OCO groups.
+
+    `groups` maps entry_id -> [tp_id, sl_id] and `meta` keeps what is needed
+    to resume a bracket after a restart (contract, side, size, tp price).
+    Every change is appended to a JSON-lines journal by a background
+    thread, so callers on the event loop never wait on disk; each batch
+    is flushed and fsynced once. Every `compact_every` records the writer
+    replaces the journal with a snapshot, keeping load() fast no matter
+    how many groups have come and gone.
+    """
+    def __init__(self, state_dir="state", compact_every=1000):
+        self.state_dir = state_dir
+        self.journal_path = os.path.join(state_dir, "oco_journal.jsonl")
+        self.snapshot_path = os.path.join(state_dir, "oco_snapshot.json")
+        self.compact_every = compact_every
+        self.groups = {}  # entry_id: [tp_id, sl_id]
+        self.meta = {}  # entry_id: placement details
+        self._records = 0
+        self._queue = queue.Queue()
+        self._writer = None
+
+    # --- Loading ---
+    def load(self):
+        """Rebuild state from the last snapshot plus the journal tail."""
+        os.makedirs(self.state_dir, exist_ok=True)
+        started = time.perf_counter()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                for group in json.load(f):
+                    self._apply({"op": "add", **group})
+
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash, nothing after it is valid
+                        logging.warning("Ignoring truncated OCO journal record")
+                        break
+                    self._apply(record)
+                    replayed += 1
+        self._records = replayed
+
+        elapsed = (time.perf_counter() - started) * 1000
+        logging.info(f"Loaded {len(self.groups)} OCO groups ({replayed} journal records) in {elapsed:.1f} ms")
+        return self.groups
+
+    def _apply(self, record):
+        entry_id = record["entry"]
+        op = record["op"]
+        if op == "add":
+            self.groups[entry_id] = list(record["legs"])
+            self.meta[entry_id] = record.get("meta", {})
+        elif op == "leg" and entry_id in self.groups:
+            self.groups[entry_id][record["index"]] = record["order"]
+        elif op == "remove":
+            self.groups.pop(entry_id, None)
+            self.meta.pop(entry_id, None)
+
+    # --- Mutations ---
+    def add(self, entry_id, legs, **meta):
+        self._record({"op": "add", "entry": entry_id, "legs": list(legs), "meta": meta})
+
+    def set_leg(self, entry_id, index, order_id):
+        self._record({"op": "leg", "entry": entry_id, "index": index, "order": order_id})
+
+    def remove(self, entry_id, reason=None):
+        self._record({"op": "remove", "entry": entry_id, "reason": reason})
+
+    def _record(self, record):
+        record["ts"] = time.time()
+        self._apply(record)
+        self._queue.put(("append", record))
+        self._records += 1
+        if self._records >= self.compact_every:
+            self._records = 0
+            snapshot = [
+                {"entry": entry_id, "legs": list(legs), "meta": self.meta.get(entry_id, {})}
+                for entry_id, legs in self.groups.items()
+            ]
+            self._queue.put(("compact", snapshot))
+
+    # --- Background writer ---
+    def start(self):
+        if self._writer is None:
+            os.makedirs(self.state_dir, exist_ok=True)
+            self._writer = threading.Thread(target=self._write_loop, name="oco-store", daemon=True)
+            self._writer.start()
+
+    def close(self):
+        if self._writer is not None:
+            self._queue.put(("stop", None))
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self):
+        journal = open(self.journal_path, "a")
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            for kind, item in batch:
+                if kind == "append":
+                    journal.write(json.dumps(item) + "\n")
+                elif kind == "compact":
+                    journal = self._compact(journal, item)
+                elif kind == "stop":
+                    running = False
+            try:
+                journal.flush()
+                os.fsync(journal.fileno())
+            except OSError as e:
+                logging.error(f"OCO journal sync failed: {e}")
+        journal.close()
+
+    def _compact(self, journal, snapshot):
+        journal.flush()
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Everything before this point is now in the snapshot
+        journal.close()
+        return open(self.journal_path, "w")
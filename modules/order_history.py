@@ -0,0 +1,110 @@
+import datetime
+from collections import OrderedDict
+from modules.order_stream import TERMINAL_STATUSES
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        ts = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=datetime.timezone.utc)
+
+def order_timestamp(order):
+    return parse_timestamp(order.get("updateTimestamp")) or parse_timestamp(order.get("creationTimestamp"))
+
+class OrderHistory(object):
+    """
+    Local id-indexed copy of the account's order history.
+
+    sync() only asks the gateway for orders since the newest timestamp
+    already seen (minus a small overlap). Lookups are O(1) by id. Memory
+    is bounded by `max_orders`; finished orders are evicted first.
+
+    Pending ids are first looked up among the open orders; only those no
+    longer open make the search reach back to their creation, so waiting
+    entries cost an open-orders payload, not a history since the oldest
+    one. Without `search_open` every pending id is reached back to.
+
+    An entry the history hasn't seen yet, e.g. one restored after a
+    restart, is reached back to through its placement time from
+    note_placed().
+
+    `search` is a coroutine function (start, end) -> list of orders or None;
+    `search_open` a coroutine function () -> list of open orders or None.
+    """
+    def __init__(self, search, lookback=300, overlap=5, max_orders=5000, search_open=None):
+        self._search = search
+        self._search_open = search_open
+        self.lookback = datetime.timedelta(seconds=lookback)
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self.max_orders = max_orders
+        self.orders = OrderedDict()  # id: order, oldest update first
+        self.high_water = None
+        self.placed = {}  # id: placement time of pending orders not seen yet
+
+    def note_placed(self, order_id, placed_at):
+        """Remember when `order_id` was placed (datetime or ISO string) until a search returns it."""
+        if isinstance(placed_at, str):
+            placed_at = parse_timestamp(placed_at)
+        if placed_at is not None and order_id not in self.orders:
+            self.placed[order_id] = placed_at
+
+    def get(self, order_id):
+        return self.orders.get(order_id)
+
+    def _window_start(self, pending_ids):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        start = self.high_water - self.overlap if self.high_water else now - self.lookback
+        for order_id in pending_ids:
+            order = self.orders.get(order_id)
+            created = parse_timestamp(order.get("creationTimestamp")) if order else self.placed.get(order_id)
+            if created and created - self.overlap < start:
+                start = created - self.overlap
+        return start
+
+    async def sync(self, pending_ids=()):
+        """Fetch orders newer than the high-water mark and any `pending_ids` that finished. Returns False on error."""
+        pending_ids = list(pending_ids)
+        if pending_ids and self._search_open is not None:
+            open_orders = await self._search_open()
+            if open_orders is None:
+                return False
+            # Open orders say nothing about what finished meanwhile, so
+            # they don't move the high-water mark
+            self.merge(open_orders, advance=False)
+            open_ids = {order.get("id") for order in open_orders}
+            pending_ids = [i for i in pending_ids if i not in open_ids]
+            if not pending_ids:
+                return True
+        start = self._window_start(pending_ids)
+        end = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=1)
+        orders = await self._search(start, end)
+        if orders is None:
+            return False
+        self.merge(orders)
+        return True
+
+    def merge(self, orders, advance=True):
+        for order in orders:
+            order_id = order.get("id")
+            if order_id is None:
+                continue
+            self.orders[order_id] = order
+            self.orders.move_to_end(order_id)
+            self.placed.pop(order_id, None)
+            ts = order_timestamp(order)
+            if advance and ts and (self.high_water is None or ts > self.high_water):
+                self.high_water = ts
+        self._evict()
+
+    def _evict(self):
+        excess = len(self.orders) - self.max_orders
+        if excess <= 0:
+            return
+        finished = [i for i, o in self.orders.items() if o.get("status") in TERMINAL_STATUSES][:excess]
+        for order_id in finished:
+            del self.orders[order_id]
+        while len(self.orders) > self.max_orders:
+            self.orders.popitem(last=False)
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import uuid
+from modules.metrics import registry
+
+RETRIES = registry.counter("tsx_order_retries_total", "Order resubmissions after an unknown outcome", ("leg",))
+RECONCILED = registry.counter("tsx_order_reconciled_total", "Unknown outcomes found already live by tag", ("leg",))
+
+def make_tag(prefix, leg):
+    """Client idempotency tag: unique per submission, stable across its retries."""
+    return f"{prefix or 'oco'}-{uuid.uuid4().hex[:12]}-{leg}"
+
+class OrderPipeline(object):
+    """
+    Places orders so that a retry can never create a duplicate.
+
+    Every order carries a unique `customTag`. `place` is a coroutine
+    function (payload, timeout) returning the gateway response, or {} when
+    the call itself failed (timeout, transport error) and the outcome is
+    unknown. An explicit rejection ({"success": false}) is returned as is.
+    An unknown outcome is first reconciled with `find_by_tag`, a coroutine
+    function returning the live order with that tag or None, and only
+    resubmitted, with the same tag, if no such order exists.
+    """
+    def __init__(self, place, find_by_tag, retries=2, timeout=5):
+        self._place = place
+        self._find_by_tag = find_by_tag
+        self.retries = retries
+        self.timeout = timeout
+
+    async def submit(self, payload, leg, tag_prefix=None):
+        payload = dict(payload)
+        if not payload.get("customTag"):
+            payload["customTag"] = make_tag(tag_prefix, leg)
+        tag = payload["customTag"]
+
+        for attempt in range(self.retries + 1):
+            try:
+                res = await asyncio.wait_for(self._place(payload, self.timeout), self.timeout)
+            except asyncio.TimeoutError:
+                res = {}
+            if "success" in res:
+                return res
+
+            existing = await self._find_by_tag(tag)
+            if existing:
+                RECONCILED.inc(leg)
+                logging.info(f"{leg} order {tag} already live as {existing.get('id')}, not resubmitting")
+                return {"success": True, "orderId": existing.get("id"), "customTag": tag, "reconciled": True}
+            if attempt < self.retries:
+                RETRIES.inc(leg)
+                logging.warning(f"{leg} order {tag} outcome unknown, retry {attempt + 1}/{self.retries}")
+
+        return {"success": False, "customTag": tag, "errorMessage": f"{leg} order not confirmed after retries"}
+
+    async def submit_legs(self, legs, tag_prefix=None):
+        """Submit independent legs concurrently. `legs` is [(leg_name, payload), ...]."""
+        return await asyncio.gather(*(
+            self.submit(payload, leg, tag_prefix) for leg, payload in legs
+        ))
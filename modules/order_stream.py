@@ -0,0 +1,198 @@
+import asyncio
+import itertools
+import json
+import logging
+import aiohttp
+
+RTC_URL = "https://rtc.topstepx.com"
+
+# Gateway order status codes
+ORDER_OPEN = 1
+ORDER_FILLED = 2
+ORDER_CANCELLED = 3
+ORDER_EXPIRED = 4
+ORDER_REJECTED = 5
+ORDER_PENDING = 6
+
+TERMINAL_STATUSES = {ORDER_FILLED, ORDER_CANCELLED, ORDER_EXPIRED, ORDER_REJECTED}
+
+RECORD_SEPARATOR = "\x1e"
+
+def unwrap_event(arg):
+    """Hub events arrive either as the order itself or as {action, data}."""
+    if isinstance(arg, dict) and isinstance(arg.get("data"), dict):
+        return arg["data"]
+    return arg
+
+class UserHub(object):
+    """
+    Minimal SignalR (JSON protocol) client for the gateway user hub.
+
+    Subscribes to order updates for `account_ids` and hands every order
+    payload to `on_order`. `get_token` is a coroutine function returning
+    the current session token. Reconnects with backoff; `connected` tells
+    the caller whether events are currently flowing: it turns True only
+    once the hub has confirmed every subscription, and False as soon as
+    the socket closes, a ping can't be sent or nothing (not even the
+    server's keep-alive) arrives for `server_timeout` seconds.
+
+    Subclasses for other hubs override `hub`, _subscribe() and _handle().
+    """
+    hub = "user"
+
+    def __init__(self, get_token, account_ids, rtc_url=RTC_URL, ping_interval=15, server_timeout=None):
+        self._get_token = get_token
+        self.account_ids = list(account_ids)
+        self.rtc_url = rtc_url.replace("https://", "wss://").replace("http://", "ws://")
+        self.ping_interval = ping_interval
+        # SignalR's own default: twice the keep-alive interval
+        self.server_timeout = server_timeout or 2 * ping_interval
+        self.on_order = None
+        self.connected = False
+        self._ws = None
+        self._invocations = itertools.count(1)
+        self._pending = {}  # invocationId → target, until the hub completes it
+
+    async def _send(self, ws, message):
+        await ws.send_str(json.dumps(message) + RECORD_SEPARATOR)
+
+    async def _invoke(self, ws, target, *arguments):
+        """Call a hub method; its completion (or error) is checked in _dispatch()."""
+        invocation_id = str(next(self._invocations))
+        self._pending[invocation_id] = target
+        await self._send(ws, {"type": 1, "invocationId": invocation_id, "target": target, "arguments": list(arguments)})
+
+    async def _ping(self, ws):
+        try:
+            while True:
+                await asyncio.sleep(self.ping_interval)
+                await self._send(ws, {"type": 6})
+        except Exception as e:
+            # Closing the socket ends the receive loop, and with it the session
+            logging.warning(f"{self.hub.title()} hub ping failed: {e}")
+            await ws.close()
+
+    async def _session(self, session, token):
+        url = f"{self.rtc_url}/hubs/{self.hub}?access_token={token}"
+        async with session.ws_connect(url, ssl=False, heartbeat=None) as ws:
+            self._pending.clear()
+            await ws.send_str(json.dumps({"protocol": "json", "version": 1}) + RECORD_SEPARATOR)
+            await self._subscribe(ws)
+            if not self._pending:
+                self._connected()
+
+            self._ws = ws
+            pinger = asyncio.create_task(self._ping(ws))
+            try:
+                while True:
+                    try:
+                        msg = await ws.receive(timeout=self.server_timeout)
+                    except asyncio.TimeoutError:
+                        raise ConnectionError(f"nothing received for {self.server_timeout}s") from None
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        raise ConnectionError(f"socket closed ({msg.type.name})")
+                    for frame in msg.data.split(RECORD_SEPARATOR):
+                        if frame:
+                            await self._dispatch(json.loads(frame))
+            finally:
+                pinger.cancel()
+                self._ws = None
+                self.connected = False
+
+    async def _dispatch(self, message):
+        if message.get("type") == 3:
+            target = self._pending.pop(message.get("invocationId"), None)
+            if message.get("error"):
+                raise ConnectionError(f"{target} failed: {message['error']}")
+            if not self.connected and not self._pending:
+                self._connected()
+            return
+        await self._handle(message)
+
+    def _connected(self):
+        self.connected = True
+        logging.info(f"{self.hub.title()} hub connected")
+
+    async def _subscribe(self, ws):
+        for account_id in self.account_ids:
+            await self._invoke(ws, "SubscribeOrders", account_id)
+
+    async def _handle(self, message):
+        if message.get("type") == 7:
+            raise ConnectionError(message.get("error") or "hub closed the connection")
+        if message.get("type") != 1 or message.get("target") != "GatewayUserOrder":
+            return
+        for arg in message.get("arguments", []):
+            if self.on_order:
+                await self.on_order(unwrap_event(arg))
+
+    async def run(self):
+        backoff = 1
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    token = await self._get_token()
+                    if token:
+                        await self._session(session, token)
+                        backoff = 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.warning(f"{self.hub.title()} hub disconnected: {e}")
+                self.connected = False
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+class FakeHub(object):
+    """
+    In-process stand-in for UserHub. push() delivers an order update the
+    same way the real hub would; drop()/restore() simulate the stream
+    going down and coming back.
+    """
+    def __init__(self):
+        self.on_order = None
+        self.connected = True
+        self._queue = asyncio.Queue()
+
+    def push(self, order):
+        self._queue.put_nowait(order)
+
+    def drop(self):
+        self.connected = False
+
+    def restore(self):
+        self.connected = True
+
+    async def run(self):
+        while True:
+            order = await self._queue.get()
+            if self.connected and self.on_order:
+                await self.on_order(unwrap_event(order))
+
+class OrderStream(object):
+    """
+    Fans order updates from a hub (UserHub, FakeHub, ...) out to every
+    subscribed handler. Handlers are coroutine functions taking the order
+    dict. A failing handler is logged and doesn't stop the others.
+    """
+    def __init__(self, hub):
+        self.hub = hub
+        self._handlers = []
+        hub.on_order = self._dispatch
+
+    @property
+    def connected(self):
+        return self.hub.connected
+
+    def subscribe(self, handler):
+        self._handlers.append(handler)
+
+    async def _dispatch(self, order):
+        for handler in self._handlers:
+            try:
+                await handler(order)
+            except Exception as e:
+                logging.error(f"Order update handler error: {e}")
+
+    async def run(self):
+        await self.hub.run()
@@ -0,0 +1,59 @@
+class FixedPolicy(object):
+    """Poll at a constant interval, whatever the market does."""
+    def __init__(self, interval=0.3):
+        self.interval = interval
+
+    def observe_latency(self, seconds):
+        pass
+
+    def next_interval(self, distances):
+        return self.interval
+
+class AdaptivePolicy(object):
+    """
+    Picks the OCO monitor's next poll interval.
+
+    `distances` has one entry per live OCO group: the distance in ticks
+    from the last known price to that group's nearest leg, or None when
+    there is no usable price. Each group adds trigger "pressure" of
+    1 / distance, so many groups or one group close to a leg both shorten
+    the interval; a single group `near_ticks` away polls at
+    `min_interval`, ten times further away ten times slower, capped at
+    `max_interval`. A group without a price always polls at the fastest
+    rate, since nothing says it is safe to wait.
+
+    The interval never drops below `latency_factor` times the recent
+    (smoothed) poll latency, so a slow gateway isn't polled faster than it
+    answers. The policy is pure arithmetic and keeps no clock of its own;
+    drive it from a real or simulated clock alike.
+    """
+    def __init__(self, min_interval=0.3, max_interval=5.0, near_ticks=4, latency_factor=2.0, smoothing=0.3):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.near_ticks = near_ticks
+        self.latency_factor = latency_factor
+        self.smoothing = smoothing
+        self.latency = None
+
+    def observe_latency(self, seconds):
+        """Feed the duration of the last poll (an EWMA is kept)."""
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.smoothing * (seconds - self.latency)
+
+    def floor(self):
+        if self.latency is None:
+            return self.min_interval
+        return max(self.min_interval, self.latency * self.latency_factor)
+
+    def next_interval(self, distances):
+        floor = self.floor()
+        if not distances:
+            return self.max_interval
+        if any(d is None for d in distances):
+            return floor
+
+        pressure = sum(1.0 / max(d, 1) for d in distances)
+        interval = self.min_interval / (self.near_ticks * pressure)
+        return min(self.max_interval, max(floor, interval))
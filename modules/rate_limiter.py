@@ -0,0 +1,225 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from modules.metrics import registry
+
+WAIT_SECONDS = registry.histogram("tsx_rate_limit_wait_seconds", "Time gateway calls waited for a rate limit token", ("bucket",))
+THROTTLED = registry.counter("tsx_rate_limit_throttled_total", "429 responses from the gateway", ("bucket",))
+
+# Priority lanes, lower goes first
+PRIORITY_ORDER = 0       # place / cancel / modify
+PRIORITY_INTERACTIVE = 1 # work done while a route handler waits
+PRIORITY_BACKGROUND = 2  # polling, account and contract refresh
+
+# Endpoint classes of api.topstepx.com paths; anything else is "default"
+ENDPOINT_CLASSES = {
+    "/api/Order/place": "orders",
+    "/api/Order/cancel": "orders",
+    "/api/Order/modify": "orders",
+    "/api/Order/search": "search",
+    "/api/Order/searchOpen": "search",
+    "/api/Auth/loginKey": "auth",
+    "/api/History/retrieveBars": "history",
+}
+
+# Gateway limits: 50 requests / 30 s for bars, 200 / 60 s for everything else
+DEFAULT_LIMITS = {
+    "api": (200 / 60.0, 20),
+    "history": (50 / 30.0, 10),
+}
+
+def endpoint_class(path):
+    return ENDPOINT_CLASSES.get(path, "default")
+
+def default_priority(path):
+    return PRIORITY_ORDER if endpoint_class(path) == "orders" else PRIORITY_INTERACTIVE
+
+class TokenBucket(object):
+    """
+    Token bucket refilled at `rate` tokens per second up to `burst`.
+    Background requests may only take a token while more than `reserve`
+    are left, so a burst of housekeeping can't use up the capacity that
+    order calls need.
+    """
+    def __init__(self, name, rate, burst, reserve=0, clock=time.monotonic):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.reserve = min(reserve, burst - 1)
+        self.tokens = float(burst)
+        self._clock = clock
+        self._updated = clock()
+        self._paused_until = 0.0
+        self.waiters = []  # heap of (priority, seq, future)
+        self.drainer = None
+        self.wake = asyncio.Event()
+
+        # Backpressure metrics
+        self.granted = 0
+        self.delayed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.max_depth = 0
+        self.throttled = 0
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def needed(self, priority):
+        return 1 + (self.reserve if priority >= PRIORITY_BACKGROUND else 0)
+
+    def wait_time(self, priority):
+        """Seconds until a request of `priority` can take a token."""
+        now = self._refill()
+        if now < self._paused_until:
+            return self._paused_until - now
+        missing = self.needed(priority) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """The server said slow down: stop granting and start empty."""
+        self._refill()
+        self.tokens = 0.0
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        self.throttled += 1
+        THROTTLED.inc(self.name)
+
+    def stats(self):
+        return {
+            "tokens": round(self.tokens, 2),
+            "queued": len(self.waiters),
+            "maxQueued": self.max_depth,
+            "granted": self.granted,
+            "delayed": self.delayed,
+            "throttled": self.throttled,
+            "avgWaitMs": round(self.wait_total / self.delayed * 1000, 1) if self.delayed else 0.0,
+            "maxWaitMs": round(self.wait_max * 1000, 1),
+        }
+
+class RequestScheduler(object):
+    """
+    Admission control for gateway calls.
+
+    `limits` maps a bucket name to (rate per second, burst). A request
+    acquires one token from each bucket it belongs to, in order; buckets
+    without a configured limit are free. Queued requests are served by
+    priority lane and then FIFO, so an order placement waiting on a busy
+    bucket is granted before polling traffic that queued earlier.
+    """
+    def __init__(self, limits=None, reserve=5, slow_wait=1.0, clock=time.monotonic):
+        self.reserve = reserve
+        self.slow_wait = slow_wait
+        self._clock = clock
+        self._seq = itertools.count()
+        self.buckets = {}
+        for name, (rate, burst) in (DEFAULT_LIMITS if limits is None else limits).items():
+            self.buckets[name] = TokenBucket(name, rate, burst, reserve=reserve, clock=clock)
+
+    async def acquire(self, bucket_names, priority=PRIORITY_INTERACTIVE):
+        for name in bucket_names:
+            bucket = self.buckets.get(name)
+            if bucket is not None:
+                await self._acquire(bucket, priority)
+
+    async def _acquire(self, bucket, priority):
+        if not bucket.waiters and bucket.wait_time(priority) == 0:
+            bucket.take()
+            bucket.granted += 1
+            WAIT_SECONDS.observe(0.0, bucket.name)
+            return
+
+        started = self._clock()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(bucket.waiters, (priority, next(self._seq), future))
+        bucket.max_depth = max(bucket.max_depth, len(bucket.waiters))
+        bucket.wake.set()  # may change who is served next
+        if bucket.drainer is None:
+            bucket.drainer = asyncio.create_task(self._drain(bucket))
+        await future
+
+        waited = self._clock() - started
+        bucket.delayed += 1
+        bucket.wait_total += waited
+        bucket.wait_max = max(bucket.wait_max, waited)
+        WAIT_SECONDS.observe(waited, bucket.name)
+        if waited >= self.slow_wait:
+            logging.warning(f"Gateway call waited {waited:.2f}s for rate limit bucket '{bucket.name}'")
+
+    async def _drain(self, bucket):
+        try:
+            while bucket.waiters:
+                priority, _, future = bucket.waiters[0]
+                if future.done():  # caller gave up
+                    heapq.heappop(bucket.waiters)
+                    continue
+                delay = bucket.wait_time(priority)
+                if delay > 0:
+                    bucket.wake.clear()
+                    try:
+                        await asyncio.wait_for(bucket.wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                heapq.heappop(bucket.waiters)
+                bucket.take()
+                bucket.granted += 1
+                future.set_result(None)
+        finally:
+            bucket.drainer = None
+
+    def throttled(self, bucket_names, retry_after=1.0):
+        """Back off every bucket of a request the gateway answered with 429."""
+        for name in bucket_names:
+            bucket = self.buckets.get(name)
+            if bucket is not None:
+                bucket.pause(retry_after)
+
+    def stats(self):
+        return {name: bucket.stats() for name, bucket in self.buckets.items()}
+
+class RemoteScheduler(object):
+    """
+    Admission through a RequestScheduler in another process, so several
+    workers draw on one set of buckets and one set of priority lanes.
+
+    `call` is a coroutine function (op, timeout=..., **args) reaching the
+    process that owns the buckets, which answers "acquire" once a token is
+    granted and applies "throttled". While it can't be reached, requests
+    fall back to the local `fallback` scheduler, which should hold only
+    this process's share of the limits.
+    """
+    def __init__(self, call, fallback, timeout=30):
+        self._call = call
+        self.fallback = fallback
+        self.timeout = timeout
+        self._pending = set()
+
+    async def acquire(self, bucket_names, priority=PRIORITY_INTERACTIVE):
+        try:
+            await self._call("acquire", timeout=self.timeout, buckets=list(bucket_names), priority=priority)
+        except Exception as e:
+            logging.warning(f"Shared rate limit unavailable ({e}), using the local share")
+            await self.fallback.acquire(bucket_names, priority)
+
+    def throttled(self, bucket_names, retry_after=1.0):
+        self.fallback.throttled(bucket_names, retry_after)
+        task = asyncio.create_task(self._report(list(bucket_names), retry_after))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _report(self, bucket_names, retry_after):
+        try:
+            await self._call("throttled", buckets=bucket_names, retry_after=retry_after)
+        except Exception as e:
+            logging.warning(f"Reporting a 429 to the shared rate limit failed: {e}")
+
+    def stats(self):
+        return self.fallback.stats()
@@ -0,0 +1,113 @@
+import itertools
+
+try:
+    import numpy as np
+except ImportError:  # what_if() falls back to plain lists
+    np = None
+
+class RiskEngine(object):
+    """
+    Sizes brackets against the loss budget still left on each account.
+
+    An account may risk `risk_fraction` of its distance to the max loss
+    line across all of its live brackets. Every bracket's risk (size x
+    stop ticks x tick value) is reserved the moment it is sized, before
+    the first await, so two signals arriving together can't both spend
+    the same budget. It is released when the placement fails or the OCO
+    group closes. Running totals per account make budget() O(1).
+
+    Native brackets are committed like client ones; the caller releases
+    them once the gateway shows their entry dropped or their legs done.
+
+    Caps: at most `max_contracts`, and at most `large_tick_max_contracts`
+    of contracts worth `large_tick_value` or more per tick while the
+    budget is under `large_tick_budget`.
+    """
+    def __init__(self, risk_fraction=0.3094, max_contracts=3, large_tick_value=5,
+                 large_tick_budget=889, large_tick_max_contracts=2):
+        self.risk_fraction = risk_fraction
+        self.max_contracts = max_contracts
+        self.large_tick_value = large_tick_value
+        self.large_tick_budget = large_tick_budget
+        self.large_tick_max_contracts = large_tick_max_contracts
+        self._open = {}  # account_id → {entry id or reservation: risk}
+        self._totals = {}  # account_id → sum of the above
+        self._reservations = itertools.count(1)
+
+    # --- Open risk bookkeeping ---
+    def open(self, account_id, key, risk):
+        book = self._open.setdefault(account_id, {})
+        self._totals[account_id] = self._totals.get(account_id, 0.0) - book.get(key, 0.0) + risk
+        book[key] = risk
+
+    def reserve(self, account_id, risk, limit=None):
+        """
+        Hold `risk` for a bracket being placed; returns the key to commit()
+        or release(), or None if that would take open risk past `limit`.
+        """
+        if limit is not None and self.open_risk(account_id) + risk > limit:
+            return None
+        key = f"pending-{next(self._reservations)}"
+        self.open(account_id, key, risk)
+        return key
+
+    def commit(self, account_id, key, entry_id):
+        """The bracket is live: move its reservation under its entry order id."""
+        risk = self._open.get(account_id, {}).pop(key, None)
+        if risk is not None:
+            self._open[account_id][entry_id] = risk
+
+    def release(self, account_id, key):
+        risk = self._open.get(account_id, {}).pop(key, None)
+        if risk is not None:
+            self._totals[account_id] -= risk
+
+    def clear(self):
+        self._open.clear()
+        self._totals.clear()
+
+    def open_risk(self, account_id):
+        return max(0.0, self._totals.get(account_id, 0.0))
+
+    def budget(self, account_id, balance, maximum_loss):
+        """Risk a new bracket on this account may still take."""
+        return max(0.0, (balance - maximum_loss) * self.risk_fraction - self.open_risk(account_id))
+
+    # --- Sizing ---
+    @staticmethod
+    def bracket_risk(size, sl_ticks, tick_value):
+        return size * sl_ticks * tick_value
+
+    def size(self, budget, sl_ticks, tick_value):
+        """Contracts that fit `budget`, before the final max_contracts cap."""
+        quantity = int(budget / (sl_ticks * tick_value))
+        if (quantity > self.large_tick_max_contracts and tick_value >= self.large_tick_value
+                and budget < self.large_tick_budget):
+            quantity = self.large_tick_max_contracts
+        return quantity
+
+    def cap(self, quantity):
+        return min(quantity, self.max_contracts)
+
+    def what_if(self, budgets, sl_ticks, tick_values):
+        """
+        Size every candidate order against every budget in one call.
+        `budgets` has one entry per account, `sl_ticks` and `tick_values`
+        one per order; returns a len(budgets) x len(sl_ticks) grid of
+        contracts, capped (an ndarray with numpy, nested lists without).
+        """
+        if np is None:
+            return [
+                [max(0, self.cap(self.size(b, t, v))) for t, v in zip(sl_ticks, tick_values)]
+                for b in budgets
+            ]
+        budget = np.asarray(budgets, dtype=np.float64)[:, None]
+        tick_value = np.asarray(tick_values, dtype=np.float64)[None, :]
+        quantity = np.floor(budget / (np.asarray(sl_ticks, dtype=np.float64)[None, :] * tick_value)).astype(np.int64)
+        large = (quantity > self.large_tick_max_contracts) & (tick_value >= self.large_tick_value) & (budget < self.large_tick_budget)
+        quantity = np.where(large, self.large_tick_max_contracts, quantity)
+        return np.clip(quantity, 0, self.max_contracts)
+
+    def stats(self):
+        return {account_id: {"openRisk": round(self.open_risk(account_id), 2), "brackets": len(book)}
+                for account_id, book in self._open.items()}
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+class TradeJournal(object):
+    """
+    Append-only JSON-lines audit trail of the order path.
+
+    record() stamps an event with wall and monotonic time and only
+    enqueues it; a background thread serializes, writes and fsyncs in
+    batches (at most once per `sync_interval` seconds), so the event loop
+    never waits on disk. When the file grows past `max_bytes` it is
+    rotated to <path>.1 ... <path>.<backups>, dropping the oldest.
+    """
+    def __init__(self, path="journal/trades.jsonl", max_bytes=50 * 1024 * 1024, backups=5, sync_interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sync_interval = sync_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=100000)
+        self._writer = None
+
+    def record(self, event, **fields):
+        fields["event"] = event
+        fields["ts"] = time.time()
+        fields["mono"] = time.monotonic()
+        try:
+            self._queue.put_nowait(("append", fields))
+        except queue.Full:
+            self.dropped += 1
+
+    # --- Background writer ---
+    def start(self):
+        if self._writer is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._writer = threading.Thread(target=self._write_loop, name="trade-journal", daemon=True)
+            self._writer.start()
+
+    def close(self):
+        if self._writer is not None:
+            self._queue.put(("stop", None))
+            self._writer.join()
+            self._writer = None
+
+    def _rotate(self, journal):
+        journal.flush()
+        os.fsync(journal.fileno())
+        journal.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        return open(self.path, "a")
+
+    def _write_loop(self):
+        journal = open(self.path, "a")
+        size = journal.tell()
+        last_sync = time.monotonic()
+        dirty = False
+        running = True
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.sync_interval)]
+            except queue.Empty:
+                batch = []
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            for kind, item in batch:
+                if kind == "stop":
+                    running = False
+                    continue
+                line = json.dumps(item, default=str) + "\n"
+                journal.write(line)
+                size += len(line)
+                dirty = True
+                if size >= self.max_bytes:
+                    journal = self._rotate(journal)
+                    size = 0
+
+            if not dirty:
+                continue
+            journal.flush()
+            if not running or time.monotonic() - last_sync >= self.sync_interval:
+                try:
+                    os.fsync(journal.fileno())
+                except OSError as e:
+                    logging.error(f"Trade journal sync failed: {e}")
+                last_sync = time.monotonic()
+                dirty = False
+        journal.close()
@@ -0,0 +1,37 @@
+import asyncio
+import heapq
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose clock only moves when there is nothing left to run:
+    instead of sleeping until the next timer it jumps straight to it. An
+    hour of asyncio.sleep()/wait_for() timeouts plays out in as long as
+    the callbacks take, and always in the same order.
+
+    Only loop time is virtual. Code that reads time.monotonic() or
+    time.time() directly still sees the real clock, and anything waiting
+    on real I/O or threads would be skipped past, so run only in-process
+    fakes on it. Relies on BaseEventLoop's _ready/_scheduled internals.
+    """
+    def __init__(self, start=0.0):
+        super(VirtualClockLoop, self).__init__()
+        self._virtual_time = start
+
+    def time(self):
+        return self._virtual_time
+
+    def _run_once(self):
+        if not self._ready and not self._stopping:
+            # Drop cancelled timers first so the jump lands on a live one
+            while self._scheduled and self._scheduled[0]._cancelled:
+                self._timer_cancelled_count -= 1
+                handle = heapq.heappop(self._scheduled)
+                handle._scheduled = False
+            if self._scheduled:
+                self._virtual_time = max(self._virtual_time, self._scheduled[0]._when)
+        super(VirtualClockLoop, self)._run_once()
+
+def run(coro, start=0.0):
+    """asyncio.run() on a VirtualClockLoop."""
+    with asyncio.Runner(loop_factory=lambda: VirtualClockLoop(start)) as runner:
+        return runner.run(coro)
@@ -0,0 +1,304 @@
+"""
+Re-run recorded sessions through the OCO logic and diff the outcome.
+
+Reads trade journals (journal/trades.jsonl and its rotations), replays
+every recorded request against modules/fake_gateway.py on a virtual
+clock, moving the fake market with the recorded quotes (journal_quotes:
+true) or, without them, with the recorded fills. Then compares which
+orders were placed, cancelled and filled, leg by leg:
+
+    python replay.py journal/trades.jsonl journal/trades.jsonl.1 --workers 4
+
+Each journal runs in its own process, since the server keeps its state
+in module globals.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from modules.fake_gateway import FakeGateway, InProcessGateway, DEFAULT_CONTRACTS
+from modules.market_data import MarketData, FakeQuoteFeed, QuoteCache
+from modules.order_stream import (
+    FakeHub, OrderStream, ORDER_FILLED, ORDER_CANCELLED, ORDER_EXPIRED, ORDER_REJECTED
+)
+from modules import virtual_clock
+
+OUTCOMES = {ORDER_FILLED: "filled", ORDER_CANCELLED: "cancelled", ORDER_EXPIRED: "expired", ORDER_REJECTED: "rejected"}
+FIELDS = ("contractId", "type", "side", "size", "price", "outcome")
+ROUTES = {1: "/place-oco", 4: "/place-oco-stop", "batch": "/place-oco-batch"}
+
+def load(path):
+    events = []
+    with open(path) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue  # torn last line of a crashed writer
+    return events
+
+def request_key(n, index=None):
+    """Batch orders are told apart by their index in the batch: "3.1"."""
+    return n if index is None else f"{n}.{index}"
+
+def leg_of(tag):
+    return tag.rsplit("-", 1)[-1] if tag else "entry"
+
+def summarize(events):
+    """
+    {(request, account, leg): {contractId, type, side, size, price, outcome}}
+    from a journal. Requests are numbered in the order they arrived, so a
+    recording and its replay line up even though order ids differ. A
+    request that failed as a whole shows up as leg "request".
+    """
+    requests = 0
+    request_index = {}  # journaled req → ordinal; a restart reuses req numbers
+    owners = {}  # entry order id → (request, account)
+    placed = []  # (order id, payload)
+    outcomes = {}  # order id → outcome
+    summary = {}
+
+    for event in events:
+        kind = event.get("event")
+        if kind == "request":
+            requests += 1
+            request_index[event.get("req")] = requests
+        elif kind == "response":
+            n = request_key(request_index.get(event.get("req")), event.get("index"))
+            body = event.get("body") or {}
+            if event.get("status") == 200 and body.get("entryOrderId"):
+                owners[body["entryOrderId"]] = (n, event.get("account"))
+            else:
+                summary[(n, event.get("account"), "request")] = {"outcome": f"{event.get('status')} {body.get('error')}"}
+        elif kind == "gateway" and event.get("endpoint") == "/api/Order/place":
+            response = event.get("response") or {}
+            if response.get("success") and response.get("orderId"):
+                placed.append((response["orderId"], event.get("request") or {}))
+        elif kind == "gateway" and event.get("endpoint") == "/api/Order/cancel":
+            if (event.get("response") or {}).get("success"):
+                outcomes.setdefault((event.get("request") or {}).get("orderId"), "cancelled")
+        elif kind == "order" and event.get("status") in OUTCOMES:
+            outcomes[event.get("order")] = OUTCOMES[event["status"]]
+
+    for order_id, payload in placed:
+        owner = owners.get(payload.get("linkedOrderId") or order_id)
+        if owner is None:
+            continue
+        summary[owner + (leg_of(payload.get("customTag")),)] = {
+            "contractId": payload.get("contractId"),
+            "type": payload.get("type"),
+            "side": payload.get("side"),
+            "size": payload.get("size"),
+            "price": payload.get("limitPrice") if payload.get("limitPrice") is not None else payload.get("stopPrice"),
+            "outcome": outcomes.get(order_id, "open"),
+            "id": order_id,
+        }
+    return summary
+
+def diff(recorded, replayed):
+    lines = []
+    for key in sorted(set(recorded) | set(replayed), key=str):
+        name = "/".join(str(k) for k in key)
+        before, after = recorded.get(key), replayed.get(key)
+        if after is None:
+            lines.append(f"- {name}: {before.get('outcome')} only in the recording")
+        elif before is None:
+            lines.append(f"+ {name}: {after.get('outcome')} only in the replay")
+        else:
+            changed = [f"{f} {before.get(f)} -> {after.get(f)}" for f in FIELDS if before.get(f) != after.get(f)]
+            if changed:
+                lines.append(f"~ {name}: " + ", ".join(changed))
+    return lines
+
+def accounts_of(events):
+    accounts = {}
+    for event in events:
+        if event.get("event") == "sizing" and event.get("accountId") not in accounts:
+            accounts[event["accountId"]] = {
+                "accountId": event["accountId"],
+                "balance": event.get("balance"),
+                "maximumLoss": event.get("maximum_loss"),
+            }
+    return list(accounts.values()) or [{"accountId": 1, "balance": 52000.0, "maximumLoss": 50000.0}]
+
+def contracts_of(events):
+    """The fake's contract list, with the contract months the recording traded."""
+    traded = {}
+    for event in events:
+        contract_id = event.get("contract") or (event.get("request") or {}).get("contractId")
+        if contract_id and contract_id.startswith("CON."):
+            traded[".".join(contract_id.split(".")[1:4])] = contract_id
+    return [
+        {
+            "productId": product_id, "contractId": traded.get(product_id, contract_id), "tickSize": tick_size,
+            "tickValue": tick_value, "pointValue": point_value, "exchangeFee": 0.35,
+            "regulatoryFee": 0.02, "totalFees": 0.37, "decimalPlaces": 2, "priceScale": 100
+        }
+        for product_id, contract_id, tick_size, tick_value, point_value in DEFAULT_CONTRACTS
+    ]
+
+def write_config(directory, accounts, args):
+    config = {
+        "username": "replay",
+        "api_key": "replay",
+        "account_id": str(accounts[0]["accountId"]),
+        "accounts": [a["accountId"] for a in accounts[1:]],
+        "discord": "",
+        "order_stream": "off",
+        "market_data": "off",
+        "state_dir": os.path.join(directory, "state"),
+        "journal_path": os.path.join(directory, "journal", "trades.jsonl"),
+        "bracket_mode": args.bracket_mode,
+        # The scheduler runs on the real clock, which barely moves during a replay
+        "rate_limits": {"api": [1e9, 1e9], "history": [1e9, 1e9]},
+    }
+    path = os.path.join(directory, "config.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f)
+    return path
+
+async def run(events, args, directory):
+    import tsx_api_server as server
+    if not args.verbose:
+        server.logging.getLogger().setLevel(server.logging.WARNING)
+    loop = asyncio.get_running_loop()
+
+    fake = FakeGateway(latency=args.latency, accounts=accounts_of(events), contracts=contracts_of(events), clock=loop.time)
+    server.gateway = InProcessGateway(fake)
+    server.gateway.journal = server.journal
+    # Fill watchers measure their not-found grace on the virtual clock too
+    for account_id in list(server.sessions):
+        server.sessions[account_id] = server.make_session(account_id, clock=loop.time)
+    if args.poll:
+        server.order_stream = None  # the monitor and fill watchers poll, as without a stream
+    else:
+        hub = FakeHub()
+        fake.on_order = hub.push
+        server.order_stream = OrderStream(hub)
+        server.order_stream.subscribe(server.on_order_update)
+
+    quotes = [e for e in events if e.get("event") == "quote"]
+    feed = None
+    if quotes:
+        feed = FakeQuoteFeed()
+        server.market_data = MarketData(feed, QuoteCache(clock=loop.time))
+    prices = QuoteCache(clock=loop.time)  # merges partial quotes into a price for the fake
+
+    # Without quotes the recorded fills move the market
+    recorded = summarize(events)
+    recorded_keys = {meta["id"]: key for key, meta in recorded.items() if "id" in meta}
+    timeline = [
+        e for e in events
+        if e.get("event") == "request"
+        or (e.get("event") == "quote" and feed is not None)
+        or (e.get("event") == "order" and e.get("status") == ORDER_FILLED and feed is None)
+    ]
+    timeline.sort(key=lambda e: e.get("mono", 0))
+    origin = timeline[0].get("mono", 0) if timeline else 0
+
+    owners = {}  # replayed entry id → (request, account)
+    pending = []
+
+    def replayed_id(key):
+        for order_id, order in fake.orders.items():
+            entry_id = order.get("linkedOrderId") or order_id
+            if owners.get(entry_id) == key[:2] and leg_of(order.get("customTag")) == key[2]:
+                return order_id
+        return None
+
+    async with server.app.test_app() as test_app:
+        client = test_app.test_client()
+        start = loop.time()
+
+        async def send(n, event):
+            route = ROUTES.get(event.get("entryType"), "/place-oco")
+            response = await client.post(route, json=event.get("body"))
+            if event.get("entryType") == "batch":
+                data = (await response.get_data()).decode()
+                results = [json.loads(line) for line in data.splitlines() if line.strip()]
+            else:
+                body = await response.get_json()
+                results = body.get("results", [body]) if isinstance(body, dict) else []
+            for result in results:
+                if result.get("entryOrderId"):
+                    owners[result["entryOrderId"]] = (request_key(n, result.get("index")), result.get("accountId"))
+
+        requests = 0
+        for event in timeline:
+            await asyncio.sleep(max(0.0, start + (event.get("mono", 0) - origin) / args.speed - loop.time()))
+            kind = event["event"]
+            if kind == "request":
+                requests += 1
+                pending.append(asyncio.ensure_future(send(requests, event)))
+            elif kind == "quote":
+                price = prices.update(event["contractId"], event.get("quote") or {}).price
+                if price is not None:
+                    fake.set_price(event["contractId"], price)
+                feed.push(event["contractId"], event.get("quote") or {})
+            elif event.get("order") in recorded_keys:
+                order_id = replayed_id(recorded_keys[event["order"]])
+                if order_id is not None:
+                    fake.fill(order_id, event.get("filledPrice"))
+
+        await asyncio.gather(*pending)
+        await asyncio.sleep(args.settle)
+
+    # Shutdown closed the journal, so everything is on disk now
+    replayed = summarize(load(os.path.join(directory, "journal", "trades.jsonl")))
+    return recorded, replayed, requests
+
+def replay_file(path, args):
+    events = load(path)
+    with tempfile.TemporaryDirectory() as directory:
+        # The server reads its config at import time
+        os.environ["TSX_CONFIG"] = write_config(directory, accounts_of(events), args)
+        recorded, replayed, requests = virtual_clock.run(run(events, args, directory))
+    lines = diff(recorded, replayed)
+    return {
+        "file": path,
+        "requests": requests,
+        "recorded_orders": sum(1 for k in recorded if k[2] != "request"),
+        "replayed_orders": sum(1 for k in replayed if k[2] != "request"),
+        "differences": len(lines),
+        "diff": lines,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded trade journals through the OCO logic")
+    parser.add_argument("journals", nargs="+", help="trade journal files, one session each")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="journals replayed in parallel")
+    parser.add_argument("--speed", type=float, default=1.0, help="divide recorded gaps by this (virtual time)")
+    parser.add_argument("--settle", type=float, default=60.0, help="virtual seconds to run after the last event")
+    parser.add_argument("--latency", type=float, default=0.05, help="virtual seconds added to every gateway call")
+    parser.add_argument("--bracket-mode", default="client", choices=["client", "native", "auto"])
+    parser.add_argument("--poll", action="store_true", help="no order stream, as recorded with order_stream: off")
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if len(args.journals) == 1:
+        reports = [replay_file(args.journals[0], args)]
+    else:
+        # A fresh process per journal: the server can only be imported once
+        with ProcessPoolExecutor(max_workers=args.workers, max_tasks_per_child=1) as pool:
+            reports = list(pool.map(replay_file, args.journals, [args] * len(args.journals)))
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for report in reports:
+            print(f"\n--- {report['file']}: {report['requests']} requests ---")
+            print(f"Orders: {report['recorded_orders']} recorded, {report['replayed_orders']} replayed, "
+                  f"{report['differences']} differences")
+            for line in report["diff"]:
+                print(f"  {line}")
+    sys.exit(1 if any(r["differences"] for r in reports) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+from modules.contract_spec import ContractSpec
+
+MNQ = {
+    "contractId": "CON.F.US.MNQ.Z25", "productId": "F.US.MNQ", "tickValue": 0.5, "tickSize": 0.25,
+    "pointValue": 2, "exchangeFee": 0.35, "regulatoryFee": 0.02, "totalFees": 0.37,
+    "decimalPlaces": 2, "priceScale": 100
+}
+
+def test_on_tick_prices_stay_put():
+    spec = ContractSpec("MNQ", MNQ)
+    for price in (21000.25, 21000.5, 0.75, 19999.0):
+        assert spec.round_to_tick(price) == price
+    assert list(spec.round_prices([21000.25, 0.75])) == [21000.25, 0.75]
+
+def test_off_tick_prices_floor_onto_the_grid():
+    spec = ContractSpec("MNQ", MNQ)
+    assert spec.round_to_tick(21000.3) == 21000.25
+    assert spec.round_to_tick(21000.74) == 21000.5
+    assert spec.ticks_between(21000.0, 20995.0) == 20
+    assert spec.add_ticks(21000.0, -3) == 20999.25
@@ -0,0 +1,56 @@
+import asyncio
+
+from modules.fill_watcher import FillWatcher
+from modules.order_stream import ORDER_FILLED
+
+class SlowSearch(object):
+    """Order search the test can hold mid-flight."""
+    def __init__(self):
+        self.orders = {}
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, order_ids):
+        self.calls.append(list(order_ids))
+        await self.release.wait()
+        self.release.clear()
+        return {i: self.orders[i] for i in order_ids if i in self.orders}
+
+def test_waiter_added_during_fetch_waits_for_next_cycle():
+    async def scenario():
+        search = SlowSearch()
+        watcher = FillWatcher(search, interval=0.01)
+        runner = asyncio.create_task(watcher.run())
+
+        first = watcher.watch(1)
+        await asyncio.sleep(0.01)
+        assert search.calls == [[1]]
+
+        # Placed while the fetch for [1] is suspended; that fetch can't know it
+        second = watcher.watch(2)
+        search.orders[1] = {"id": 1, "status": ORDER_FILLED, "filledPrice": 100.0}
+        search.release.set()
+        assert (await first)["filledPrice"] == 100.0
+        assert not second.done()
+
+        search.orders[2] = {"id": 2, "status": ORDER_FILLED, "filledPrice": 101.0}
+        search.release.set()
+        assert (await asyncio.wait_for(second, 1))["filledPrice"] == 101.0
+        runner.cancel()
+
+    asyncio.run(scenario())
+
+def test_not_found_is_retried_until_grace_expires():
+    async def scenario():
+        now = [0.0]
+        watcher = FillWatcher(None, not_found_grace=30, clock=lambda: now[0])
+        waiter = watcher.watch(7)
+
+        watcher.on_orders({}, [7])
+        assert not waiter.done()
+
+        now[0] = 31.0
+        watcher.on_orders({}, [7])
+        assert waiter.result() is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+import json
+import os
+
+from modules.oco_store import OcoStore
+
+def test_oco_store_survives_a_restart(tmp_path):
+    store = OcoStore(str(tmp_path))
+    store.load()
+    store.start()
+    store.add(1, [None, 2], contractId="CON.F.US.MNQ.Z25", side=0, size=1, tp=110.0)
+    store.set_leg(1, 0, 3)
+    store.add(4, [None, 5], contractId="CON.F.US.MNQ.Z25", side=1, size=2, tp=90.0)
+    store.remove(4, "closed")
+    store.close()
+
+    restored = OcoStore(str(tmp_path))
+    assert restored.load() == {1: [3, 2]}
+    assert restored.meta[1]["tp"] == 110.0
+
+def test_oco_store_compacts_into_a_snapshot(tmp_path):
+    store = OcoStore(str(tmp_path), compact_every=3)
+    store.load()
+    store.start()
+    for entry_id in (1, 2, 3):
+        store.add(entry_id, [None, entry_id + 100])
+    store.remove(2)
+    store.close()
+
+    with open(os.path.join(str(tmp_path), "oco_snapshot.json")) as f:
+        assert [g["entry"] for g in json.load(f)] == [1, 2, 3]
+    with open(os.path.join(str(tmp_path), "oco_journal.jsonl")) as f:
+        assert [json.loads(line)["op"] for line in f] == ["remove"]
+
+    restored = OcoStore(str(tmp_path))
+    assert restored.load() == {1: [None, 101], 3: [None, 103]}
+
+def test_oco_store_ignores_a_torn_last_record(tmp_path):
+    store = OcoStore(str(tmp_path))
+    store.load()
+    store.start()
+    store.add(1, [None, 2])
+    store.close()
+    with open(os.path.join(str(tmp_path), "oco_journal.jsonl"), "a") as f:
+        f.write('{"op": "remove", "ent')
+
+    assert OcoStore(str(tmp_path)).load() == {1: [None, 2]}
@@ -0,0 +1,56 @@
+import asyncio
+import datetime
+
+from modules.order_history import OrderHistory
+
+def test_restored_entry_is_searched_from_its_placement_time():
+    async def scenario():
+        windows = []
+        placed = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)
+        entry = {"id": 5, "status": 1, "creationTimestamp": placed.isoformat()}
+
+        async def search(start, end):
+            windows.append(start)
+            return [entry] if start <= placed else []
+
+        history = OrderHistory(search, lookback=300)
+        history.note_placed(5, placed.isoformat())
+        await history.sync([5])
+        assert windows[0] <= placed
+        assert history.get(5) is entry
+        assert 5 not in history.placed
+
+    asyncio.run(scenario())
+
+def test_only_entries_gone_from_the_open_orders_reach_back():
+    async def scenario():
+        now = datetime.datetime.now(datetime.timezone.utc)
+        created = now - datetime.timedelta(hours=2)
+        entry = {"id": 5, "status": 1, "creationTimestamp": created.isoformat(), "updateTimestamp": now.isoformat()}
+        windows = []
+        open_orders = [entry]
+
+        async def search(start, end):
+            windows.append(start)
+            return [dict(entry, status=2)] if start <= created else []
+
+        async def search_open():
+            return list(open_orders)
+
+        history = OrderHistory(search, lookback=300, search_open=search_open)
+        history.high_water = now - datetime.timedelta(seconds=30)
+        assert await history.sync([5])
+        assert windows == []  # still open: nothing to search for
+        assert history.get(5)["status"] == 1
+        assert history.high_water == now - datetime.timedelta(seconds=30)
+
+        open_orders.clear()
+        assert await history.sync([5])
+        assert windows[0] <= created
+        assert history.get(5)["status"] == 2
+
+        # Later syncs start from the high-water mark again
+        assert await history.sync()
+        assert windows[1] > now - datetime.timedelta(minutes=1)
+
+    asyncio.run(scenario())
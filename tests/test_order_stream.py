@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from modules.fill_watcher import FillWatcher
+from modules.order_stream import (
+    UserHub, FakeHub, OrderStream, RECORD_SEPARATOR, ORDER_CANCELLED, ORDER_FILLED, ORDER_OPEN
+)
+
+def frames(data):
+    return [json.loads(frame) for frame in data.split(RECORD_SEPARATOR) if frame]
+
+class SignalRServer(object):
+    """
+    Just enough of a SignalR user hub: acks the handshake, completes (or
+    fails) each invocation and answers pings with its keep-alive; with
+    `stall` it goes silent after the invocations.
+    """
+    def __init__(self, error=None, stall=False):
+        self.error = error
+        self.stall = stall
+        self.invocations = []
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            for frame in frames(msg.data):
+                if "protocol" in frame:
+                    await ws.send_str("{}" + RECORD_SEPARATOR)
+                elif frame.get("type") == 6 and not self.stall:
+                    await ws.send_str(json.dumps({"type": 6}) + RECORD_SEPARATOR)
+                elif frame.get("type") == 1:
+                    self.invocations.append(frame)
+                    completion = {"type": 3, "invocationId": frame["invocationId"]}
+                    if self.error:
+                        completion["error"] = self.error
+                    await ws.send_str(json.dumps(completion) + RECORD_SEPARATOR)
+                    if not self.stall:
+                        order = {"id": 7, "accountId": frame["arguments"][0], "status": ORDER_FILLED}
+                        event = {"type": 1, "target": "GatewayUserOrder", "arguments": [{"action": 1, "data": order}]}
+                        await ws.send_str(json.dumps(event) + RECORD_SEPARATOR)
+        return ws
+
+async def start(server):
+    app = web.Application()
+    app.router.add_get("/hubs/user", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+async def token():
+    return "token"
+
+def test_connected_once_the_subscription_completes():
+    async def scenario():
+        server = SignalRServer()
+        runner, url = await start(server)
+        hub = UserHub(token, [11], rtc_url=url, ping_interval=0.05)
+        orders = []
+
+        async def on_order(order):
+            orders.append((hub.connected, order))
+        hub.on_order = on_order
+
+        async with aiohttp.ClientSession() as session:
+            task = asyncio.create_task(hub._session(session, "token"))
+            await asyncio.sleep(0.2)
+            assert hub.connected
+            task.cancel()
+        await runner.cleanup()
+        assert server.invocations[0]["target"] == "SubscribeOrders"
+        assert server.invocations[0]["invocationId"]
+        assert orders == [(True, {"id": 7, "accountId": 11, "status": ORDER_FILLED})]
+
+    asyncio.run(scenario())
+
+def test_failed_subscription_never_counts_as_connected():
+    async def scenario():
+        runner, url = await start(SignalRServer(error="not authorized"))
+        hub = UserHub(token, [11], rtc_url=url, ping_interval=0.05)
+        async with aiohttp.ClientSession() as session:
+            with pytest.raises(ConnectionError, match="SubscribeOrders failed: not authorized"):
+                await asyncio.wait_for(hub._session(session, "token"), 1)
+        await runner.cleanup()
+        assert not hub.connected
+
+    asyncio.run(scenario())
+
+def test_silent_socket_is_torn_down():
+    async def scenario():
+        runner, url = await start(SignalRServer(stall=True))
+        hub = UserHub(token, [11], rtc_url=url, ping_interval=0.05, server_timeout=0.2)
+        async with aiohttp.ClientSession() as session:
+            task = asyncio.create_task(hub._session(session, "token"))
+            await asyncio.sleep(0.1)
+            assert hub.connected
+            with pytest.raises(ConnectionError, match="nothing received"):
+                await asyncio.wait_for(task, 1)
+        await runner.cleanup()
+        assert not hub.connected
+
+    asyncio.run(scenario())
+
+def test_fill_watcher_resolves_from_the_stream():
+    async def scenario():
+        hub = FakeHub()
+        stream = OrderStream(hub)
+        fetched = []
+
+        async def fetch(order_ids):
+            fetched.append(order_ids)
+            return {i: {"id": i, "status": ORDER_OPEN} for i in order_ids}
+
+        watcher = FillWatcher(fetch, interval=0.01, is_streaming=lambda: stream.connected)
+        stream.subscribe(watcher.on_order_update)
+        tasks = [asyncio.create_task(stream.run()), asyncio.create_task(watcher.run())]
+
+        filled = watcher.watch(10)
+        cancelled = watcher.watch(11)
+        await asyncio.sleep(0.05)
+        assert len(fetched) == 1  # one catch-up fetch, then the stream takes over
+
+        hub.push({"id": 10, "status": ORDER_FILLED, "filledPrice": 100.25})
+        hub.push({"action": 1, "data": {"id": 11, "status": ORDER_CANCELLED}})
+        assert (await asyncio.wait_for(filled, 1))["filledPrice"] == 100.25
+        assert await asyncio.wait_for(cancelled, 1) is None
+        for task in tasks:
+            task.cancel()
+
+    asyncio.run(scenario())
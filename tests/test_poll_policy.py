@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from modules import virtual_clock
+from modules.poll_policy import AdaptivePolicy
+
+def test_policy_interval_scales_with_distance():
+    policy = AdaptivePolicy(min_interval=0.3, max_interval=5.0, near_ticks=4)
+    assert policy.next_interval([]) == 5.0
+    assert policy.next_interval([4]) == pytest.approx(0.3)
+    assert policy.next_interval([8]) == pytest.approx(0.6)
+    assert policy.next_interval([4000]) == 5.0
+    assert policy.next_interval([40, None]) == 0.3  # no price, no waiting
+    # Two groups at 8 ticks press as hard as one at 4
+    assert policy.next_interval([8, 8]) == pytest.approx(0.3)
+
+def test_policy_never_polls_faster_than_the_gateway_answers():
+    policy = AdaptivePolicy(min_interval=0.3, latency_factor=2.0, smoothing=0.5)
+    policy.observe_latency(0.5)
+    assert policy.next_interval([1]) == pytest.approx(1.0)
+    policy.observe_latency(0.1)
+    assert policy.next_interval([1]) == pytest.approx(0.6)
+
+def test_policy_polls_on_a_simulated_clock():
+    async def monitor(distance, seconds):
+        loop = asyncio.get_running_loop()
+        policy = AdaptivePolicy(min_interval=0.3, max_interval=5.0, near_ticks=4)
+        polls = 0
+        while loop.time() < seconds:
+            polls += 1
+            await asyncio.sleep(policy.next_interval([distance]))
+        return polls
+
+    # Ten virtual minutes, no real waiting
+    assert virtual_clock.run(monitor(4000, 600)) == 120
+    assert virtual_clock.run(monitor(4, 600)) == 2000
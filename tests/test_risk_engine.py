@@ -0,0 +1,22 @@
+from modules.risk_engine import RiskEngine
+
+def test_reservations_hold_budget_until_released():
+    risk = RiskEngine(risk_fraction=0.5, max_contracts=3)
+    assert risk.budget(1, 1200.0, 1000.0) == 100.0
+
+    first = risk.reserve(1, 60.0, limit=100.0)
+    assert risk.budget(1, 1200.0, 1000.0) == 40.0
+    assert risk.reserve(1, 60.0, limit=100.0) is None
+
+    risk.commit(1, first, 1000)
+    risk.release(1, first)  # already committed, nothing to release
+    assert risk.open_risk(1) == 60.0
+    risk.release(1, 1000)
+    assert risk.open_risk(1) == 0.0
+    assert risk.reserve(1, 60.0, limit=100.0) is not None
+
+def test_size_caps_large_tick_contracts_on_small_budgets():
+    risk = RiskEngine(max_contracts=3, large_tick_value=5, large_tick_budget=889, large_tick_max_contracts=2)
+    assert risk.cap(risk.size(800.0, 20, 0.5)) == 3
+    assert risk.size(800.0, 20, 5) == 2
+    assert risk.size(1000.0, 20, 5) == 10
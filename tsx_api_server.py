@@ -1,32 +1,92 @@
-import requests
 import yaml
 import asyncio
+import aiohttp
 import logging
-import urllib3
 # from quart import Quart, request, jsonify
-from quart import Quart, render_template, request, jsonify
+from quart import Quart, render_template, request, jsonify, make_response
 from modules.discord import Alert
+from modules.gateway import Gateway, API_URL, USER_API_URL
+from modules.auth import TokenManager
+from modules.account_cache import AccountCache
+from modules.order_stream import OrderStream, UserHub, RTC_URL, TERMINAL_STATUSES, ORDER_FILLED
+from modules.fill_watcher import FillWatcher
+from modules.order_history import OrderHistory
+from modules.oco_store import OcoStore
+from modules.contract_cache import ContractCache
+from modules.contract_index import ContractIndex
+from modules.order_pipeline import OrderPipeline
+from modules.account_session import AccountSession
+from modules.rate_limiter import RequestScheduler, RemoteScheduler, DEFAULT_LIMITS, PRIORITY_BACKGROUND
+from modules.poll_policy import AdaptivePolicy, FixedPolicy
+from modules.market_data import MarketData, MarketHub, Quote, QuoteCache, choose_entry_type, check_bracket
+from modules.metrics import registry
+from modules.trade_journal import TradeJournal
+from modules.risk_engine import RiskEngine
+from modules.leader import LeaderLock, LeaderServer, LeaderClient
+from modules.event_hub import EventHub, sse
 import json
-import math
+import os
 import datetime
-
-# --- Suppress SSL warnings ---
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import functools
+import itertools
+import time
 
 # --- Load config ---
-with open("config.yaml") as f:
+with open(os.environ.get("TSX_CONFIG", "config.yaml")) as f:
     config = yaml.safe_load(f)
 
-API_URL = "https://api.topstepx.com"
 USERNAME = config["username"]
 API_KEY = config["api_key"]
-ACCOUNT_ID = int(config["account_id"])
+ACCOUNT_ID = int(config["account_id"])  # default account for requests that don't name one
+ACCOUNT_IDS = [ACCOUNT_ID] + [int(a) for a in config.get("accounts", []) if int(a) != ACCOUNT_ID]
+STATE_DIR = config.get("state_dir", "state")
+WORKERS = int(config.get("workers", 1))  # > 1: serve with hypercorn; one elected worker runs the OCO engine
 
 app = Quart(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-oco_orders = {}  # entry_id: [tp_id, sl_id]
-contract_map = {}  # "MYM" → full contract metadata dict
+background_tasks = set()  # cancelled on shutdown, before the gateway closes
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+sessions = {}  # account_id → AccountSession
+contract_map = ContractIndex()  # "MYM" → ContractSpec, plus lookups by contractId/productId
+# Every gateway call goes through one scheduler: token buckets per endpoint
+# class, with order place/cancel served ahead of polling and refreshes.
+# With several workers the leader's scheduler is the one budget; followers
+# take their tokens from it (see start_follower)
+limits = dict(DEFAULT_LIMITS, **config.get("rate_limits", {}))
+scheduler = RequestScheduler(limits, reserve=config.get("rate_limit_reserve", 5))
+# Audit trail of requests, sizing, order calls and OCO transitions
+journal_path = config.get("journal_path", os.path.join("journal", "trades.jsonl"))
+if WORKERS > 1:
+    journal_path = "{0}-{2}{1}".format(*os.path.splitext(journal_path), os.getpid())  # one file per worker
+journal = TradeJournal(
+    journal_path,
+    max_bytes=config.get("journal_max_bytes", 50 * 1024 * 1024),
+    backups=config.get("journal_backups", 5)
+)
+# Order acks, fills, OCO changes and balances pushed to /events clients
+events = EventHub(max_queue=config.get("push_queue_size", 256))
+gateway = Gateway(
+    config.get("api_url", API_URL),
+    config.get("user_api_url", USER_API_URL),
+    timeout=config.get("http_timeout", 10),
+    scheduler=scheduler,
+    journal=journal
+)
+
+# --- Metrics ---
+ENTRY_ACK = registry.histogram("tsx_entry_ack_seconds", "Order request received to entry order acked", ("mode",))
+STOP_ACK = registry.histogram("tsx_stop_ack_seconds", "Entry ack to protective stop acked")
+PROTECTED = registry.histogram("tsx_bracket_protected_seconds", "Order request received to position protected", ("mode",))
+TP_PLACED = registry.histogram("tsx_tp_placed_seconds", "Entry fill seen to take-profit acked")
+SIBLING_CANCEL = registry.histogram("tsx_sibling_cancel_seconds", "OCO leg finished to surviving leg cancelled")
+MONITOR_POLLS = registry.counter("tsx_monitor_polls_total", "OCO monitor /searchOpen passes")
 
 # --- Auth ---
 # def get_token():
@@ -44,288 +104,841 @@ contract_map = {}  # "MYM" → full contract metadata dict
 #     except Exception as e:
 #         logging.error(f"Auth error: {e}")
 #         return None
-TOKEN = None
-def get_token(force_refresh=False):
-    """
-    Return (token, account_info). Use cached token if account_info validates it.
-    """
-    global TOKEN
-    if TOKEN and not force_refresh:
-        account_info = get_account_info(TOKEN)
-        if account_info:
-            return TOKEN, account_info
-        else:
-            logging.info("Cached token invalid, refreshing...")
-            TOKEN = None
-
+async def login():
+    if not is_leader():
+        # Followers share the leader's session instead of logging in themselves
+        try:
+            return await leader_client.call("token")
+        except Exception as e:
+            logging.error(f"Token from leader failed: {e}")
+            return None
     try:
-        res = requests.post(
-            f"{API_URL}/api/Auth/loginKey",
-            json={"userName": USERNAME, "apiKey": API_KEY},
-            headers={"Content-Type": "application/json"},
-            timeout=10,
-            verify=False
+        data = await gateway.post(
+            "/api/Auth/loginKey",
+            {"userName": USERNAME, "apiKey": API_KEY},
+            timeout=10
         )
-        res.raise_for_status()
-        data = res.json()
-        token = data.get("token") if data.get("success") else None
-
-        if token:
-            account_info = get_account_info(token)
-            if account_info:
-                TOKEN = token
-                return TOKEN, account_info
-            else:
-                logging.warning("New token failed validation.")
-                return None, None
-        else:
-            return None, None
+        return data.get("token") if data.get("success") else None
     except Exception as e:
         logging.error(f"Auth error: {e}")
-        return None, None
+        return None
+
+token_manager = TokenManager(
+    login,
+    ttl=config.get("token_ttl", 23 * 3600),
+    refresh_margin=config.get("token_refresh_margin", 600)
+)
+
+async def get_token(force_refresh=False):
+    """
+    Return the cached session token, logging in only when it is missing,
+    near expiry or was rejected with a 401.
+    """
+    if force_refresh:
+        return await token_manager.refresh(force=True)
+    return await token_manager.get()
+
+def check_unauthorized(e, token):
+    if isinstance(e, aiohttp.ClientResponseError) and e.status == 401:
+        token_manager.invalidate(token)
 
 # --- API POST ---
-def api_post(token, endpoint, payload):
+async def api_post(token, endpoint, payload, timeout=None, priority=None):
     try:
-        res = requests.post(
-            f"{API_URL}{endpoint}",
-            json=payload,
-            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-            verify=False
-        )
-        res.raise_for_status()
-        return res.json()
+        return await gateway.post(endpoint, payload, token=token, timeout=timeout, priority=priority)
     except Exception as e:
+        check_unauthorized(e, token)
         logging.error(f"API error on {endpoint}: {e}")
         return {}
 
 # --- Cancel Order ---
-def cancel_order(token, account_id, order_id):
+async def cancel_order(token, account_id, order_id):
     try:
-        res = requests.post(
-            f"{API_URL}/api/Order/cancel",
-            json={"accountId": account_id, "orderId": order_id},
-            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-            verify=False
+        res = await gateway.post(
+            "/api/Order/cancel",
+            {"accountId": account_id, "orderId": order_id},
+            token=token,
+            timeout=5
         )
-        res.raise_for_status()
-        return res.json().get("success", False)
+        return res.get("success", False)
     except Exception as e:
+        check_unauthorized(e, token)
         logging.error(f"Cancel failed for {order_id}: {e}")
         return False
 
 # --- Load Contracts ---
-def load_contracts():
-    token, _ = get_token()
+contract_cache = ContractCache(os.path.join(STATE_DIR, "contracts.json"))
+
+def swap_contract_map(contracts):
+    """Build the new index off to the side, then publish it in one assignment."""
+    global contract_map
+    index = ContractIndex(contracts, previous=contract_map)
+    for symbol, old_id, new_id in index.rolls:
+        logging.warning(f"{symbol} rolled from {old_id} to {new_id}")
+        journal.record("roll", symbol=symbol, old=old_id, new=new_id)
+        watch_contract(new_id)
+    contract_map = index
+
+def load_cached_contracts():
+    contracts = contract_cache.load()
+    if not contracts:
+        contract_cache.etag = contract_cache.last_modified = None
+        return False
+    swap_contract_map(contracts)
+    logging.info(f"Loaded {len(contract_map)} contracts from cache")
+    return True
+
+async def load_contracts():
+    if not is_leader():
+        return await load_contracts_from_leader()
+    token = await get_token()
     if not token:
         logging.error("Contract preload failed: auth error")
         return
 
     try:
-        res = requests.get(
-            "https://userapi.topstepx.com/UserContract/active/nonprofesional",
-            headers={
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json",
-                "User-Agent": "Mozilla/5.0",
-                "x-app-type": "px-desktop",
-                "x-app-version": "1.21.1"
-            },
-            verify=False
+        contracts, etag, last_modified = await gateway.get_user_if_modified(
+            "/UserContract/active/nonprofesional",
+            token=token,
+            etag=contract_cache.etag,
+            last_modified=contract_cache.last_modified,
+            timeout=30,
+            priority=PRIORITY_BACKGROUND
         )
-        res.raise_for_status()
-        contracts = res.json()
+        if contracts is None:
+            logging.info("Contracts not modified")
+            return
         if not isinstance(contracts, list):
             logging.warning("Unexpected contract format.")
             return
+        if contract_map and not contract_cache.changed(contracts):
+            logging.info("Contracts unchanged")
+            return
 
-        for c in contracts:
-            if c.get("disabled"):
-                continue
-            product_id = c.get("productId")
-            if not product_id or not c.get("contractId"):
-                continue
-            parts = product_id.split(".")
-            if len(parts) >= 3:
-                short_symbol = parts[-1]
-                if short_symbol == "ENQ": short_symbol = "NQ"
-                elif short_symbol == "EP": short_symbol = "ES"
-                elif short_symbol == "GCE": short_symbol = "GC"
-                contract_map[short_symbol] = {
-                    "contractId": c["contractId"],
-                    "tickValue": c["tickValue"],
-                    "tickSize": c["tickSize"],
-                    "pointValue": c["pointValue"],
-                    "exchangeFee": c["exchangeFee"],
-                    "regulatoryFee": c["regulatoryFee"],
-                    "totalFees": c["totalFees"],
-                    "decimalPlaces": c["decimalPlaces"],
-                    "priceScale": c["priceScale"]
-                }
-        print(contract_map)
+        swap_contract_map(contracts)
+        contract_cache.save(contracts, etag, last_modified)
 
         logging.info(f"Loaded {len(contract_map)} contracts")
-        print("\n--- Contract Map ---")
-        print(contract_map)
-        for k, v in contract_map.items():
-            print(f"{k}: {v['contractId']}")
-        
+        logging.debug(", ".join(f"{k}: {v.contractId}" for k, v in contract_map.items()))
     except Exception as e:
         logging.error(f"UserContract load error: {e}")
 
+async def load_contracts_from_leader():
+    try:
+        contracts = await leader_client.call("contracts")
+    except Exception as e:
+        logging.error(f"Contracts from leader failed: {e}")
+        return
+    if contracts:
+        swap_contract_map(contracts)
+
+async def refresh_contracts():
+    while True:
+        await asyncio.sleep(config.get("contract_refresh_interval", 3600))
+        await load_contracts()
+
+# --- Push Events ---
+def publish(event, data):
+    """
+    Push an event to every /events client, in every worker. Events go
+    out through the leader so all workers share one sequence.
+    """
+    if is_leader():
+        message = events.publish(event, data)
+        if leader_server is not None:
+            leader_server.broadcast(message)
+    else:
+        spawn(relay_event(event, data))
+
+async def relay_event(event, data):
+    try:
+        await leader_client.call("publish", event=event, data=data)
+    except Exception as e:
+        logging.warning(f"Pushing {event} through the leader failed: {e}")
+
+def record_oco(session, entry_id, op, **fields):
+    journal.record("oco", account=session.account_id, entry=entry_id, op=op, **fields)
+    publish("oco", dict(fields, accountId=session.account_id, entryOrderId=entry_id, op=op))
+
+def record_order(account_id, order_id, status, filled_price):
+    journal.record("order", account=account_id, order=order_id, status=status, filledPrice=filled_price)
+    publish("order", {"accountId": account_id, "orderId": order_id, "status": status, "filledPrice": filled_price})
+
+def on_accounts_changed(previous, accounts):
+    if not is_leader():
+        return  # every worker refreshes; the leader's copy speaks for all
+    for account_id, account in accounts.items():
+        before = (previous or {}).get(account_id) or {}
+        if account.get("balance") != before.get("balance") or account.get("maximumLoss") != before.get("maximumLoss"):
+            publish("balance", {
+                "accountId": account_id,
+                "balance": account.get("balance"),
+                "maximumLoss": account.get("maximumLoss")
+            })
+
+# --- OCO Engine ---
+async def close_oco_group(token, session, entry_id, remaining_id):
+    """
+    Cancel the surviving leg of an OCO group and stop tracking it.
+    `remaining_id` is None when the other leg is already inactive.
+    """
+    if entry_id not in session.oco_orders:
+        return
+    # Drop the group first so a stream event and a poll can't both cancel it
+    session.oco_store.remove(entry_id, "closed")
+    risk.release(session.account_id, entry_id)
+    record_oco(session, entry_id, "close", cancel=remaining_id)
+    session.fill_watcher.forget(entry_id)
+
+    if remaining_id:
+        started = time.perf_counter()
+        success = await cancel_order(token, session.account_id, remaining_id)
+        SIBLING_CANCEL.observe(time.perf_counter() - started)
+        if success:
+            logging.info(f"Canceled remaining OCO leg: {remaining_id}")
+        else:
+            logging.warning(f"Failed to cancel remaining leg: {remaining_id}")
+    else:
+        logging.info(f"Remaining OCO leg already inactive for entry {entry_id}")
+
+    account_cache.invalidate()
+
+async def handle_order_update(session, order):
+    """Close the OCO group a finished leg belongs to."""
+    order_id = order.get("id")
+    if order.get("status") not in TERMINAL_STATUSES:
+        return
+
+    for entry_id, (tp_id, sl_id) in list(session.oco_orders.items()):
+        if order_id == entry_id and order.get("status") != ORDER_FILLED:
+            # Entry will never fill, its protective stop has nothing to protect
+            logging.info(f"Entry {entry_id} ended with status {order.get('status')}")
+            await close_oco_group(await get_token(), session, entry_id, sl_id)
+        elif order_id in (tp_id, sl_id):
+            remaining_id = sl_id if order_id == tp_id else tp_id
+            await close_oco_group(await get_token(), session, entry_id, remaining_id)
+
+def sessions_for_order(order):
+    session = sessions.get(order.get("accountId"))
+    return [session] if session else list(sessions.values())
+
+async def on_order_update(order):
+    """Route a pushed order update to its account's OCO engine and fill watcher."""
+    note_fill_price(order)
+    if order.get("status") in TERMINAL_STATUSES:
+        record_order(order.get("accountId"), order.get("id"), order.get("status"), order.get("filledPrice"))
+    for session in sessions_for_order(order):
+        await handle_order_update(session, order)
+        await session.fill_watcher.on_order_update(order)
+
+if config.get("order_stream", "signalr") == "signalr":
+    order_stream = OrderStream(UserHub(get_token, ACCOUNT_IDS, rtc_url=config.get("rtc_url", RTC_URL)))
+    order_stream.subscribe(on_order_update)
+else:
+    order_stream = None
+
+# Quotes for validation and the monitor's price proximity; None when off
+if config.get("market_data", "signalr") == "signalr":
+    market_data = MarketData(
+        MarketHub(get_token, rtc_url=config.get("rtc_url", RTC_URL)),
+        QuoteCache(
+            depth=config.get("market_data_depth", 64),
+            max_age=config.get("market_data_max_age", 5)
+        ),
+        journal=journal if config.get("journal_quotes", False) else None
+    )
+else:
+    market_data = None
+
+def fresh_quote(contract_id):
+    if market_data is None:
+        return None
+    return market_data.cache.fresh(contract_id)
+
+def watch_contract(contract_id):
+    if market_data is not None:
+        market_data.watch(contract_id)
+
+async def current_quote(contract_id):
+    """Fresh quote to validate an order against; followers ask the leader's stream."""
+    if is_leader():
+        watch_contract(contract_id)
+        return fresh_quote(contract_id)
+    try:
+        data = await leader_client.call("quote", contractId=contract_id)
+    except Exception as e:
+        logging.warning(f"Quote from leader failed: {e}")
+        return None
+    return None if data is None else Quote(contract_id, data["bid"], data["ask"], data["last"])
+
+def stream_connected():
+    return order_stream is not None and order_stream.connected
+
+async def reconcile_open_orders(token, session):
+    """Check every complete OCO group against /searchOpen and close finished ones."""
+    # Only judge legs that existed before the snapshot; a TP placed while
+    # the search was in flight would otherwise look filled
+    groups = [(entry_id, list(linked_ids)) for entry_id, linked_ids in session.oco_orders.items()]
+    response = await api_post(
+        token, "/api/Order/searchOpen", {"accountId": session.account_id}, priority=PRIORITY_BACKGROUND
+    )
+    if "orders" not in response:
+        return
+    active_ids = {o["id"] for o in response["orders"] if "id" in o}
+    synced = False
+
+    for entry_id, linked_ids in groups:
+        if not entry_id or not all(linked_ids):
+            continue
+
+        tp_id, sl_id = linked_ids
+        tp_missing = tp_id not in active_ids
+        sl_missing = sl_id not in active_ids
+
+        # If either SL or TP is triggered, cancel the other
+        if tp_missing or sl_missing:
+            # No stream told us how the leg ended; the order history knows
+            if not synced:
+                synced = await session.order_history.sync()
+            exited_id = tp_id if tp_missing else sl_id
+            exited = session.order_history.get(exited_id) or {}
+            if exited.get("status") in TERMINAL_STATUSES:
+                record_order(session.account_id, exited_id, exited["status"], exited.get("filledPrice"))
+            remaining_id = sl_id if tp_missing else tp_id
+            await close_oco_group(token, session, entry_id, remaining_id if remaining_id in active_ids else None)
+
 # --- Monitor OCO Orders ---
+if config.get("poll_policy", "adaptive") == "fixed":
+    poll_policy = FixedPolicy(config.get("poll_min_interval", 0.3))
+else:
+    poll_policy = AdaptivePolicy(
+        min_interval=config.get("poll_min_interval", 0.3),
+        max_interval=config.get("poll_max_interval", 5.0),
+        near_ticks=config.get("poll_near_ticks", 4)
+    )
+PRICE_TTL = config.get("poll_price_ttl", 30)  # older prices count as unknown
+last_prices = {}  # contract_id → (price, monotonic time) of the latest fill seen, for when there is no quote
+monitor_wake = asyncio.Event()  # set when a new group needs watching now
+
+def note_fill_price(order):
+    price = order.get("filledPrice")
+    if price is not None and order.get("contractId"):
+        last_prices[order["contractId"]] = (price, time.monotonic())
+
+def market_price(contract_id):
+    quote = fresh_quote(contract_id)
+    if quote is not None and quote.price is not None:
+        return quote.price
+    price, seen = last_prices.get(contract_id, (None, 0))
+    if price is None or time.monotonic() - seen > PRICE_TTL:
+        return None
+    return price
+
+def contract_for_id(contract_id):
+    return contract_map.by_contract_id(contract_id)
+
+def group_distance(meta):
+    """Ticks from the last known price to the group's nearest leg, or None."""
+    contract_id = meta.get("contractId")
+    price = market_price(contract_id)
+    contract = contract_for_id(contract_id)
+    legs = [meta[k] for k in ("tp", "sl") if meta.get(k) is not None]
+    if price is None or contract is None or len(legs) < 2:
+        return None
+    return min(contract.ticks_between(price, leg) for leg in legs)
+
 async def monitor_oco_orders():
+    """
+    Polling fallback for the order stream, shared by all accounts. Idles
+    while the stream is up, polls /searchOpen for every account with live
+    groups (concurrently) while it is down, and runs one catch-up poll
+    when the stream comes back in case events were missed during the gap.
+    The poll interval comes from `poll_policy`: fast near a trigger, slow
+    when every leg is far from the market.
+    """
+    resync = False
     while True:
-        if not oco_orders:
+        if stream_connected() and not resync:
+            await asyncio.sleep(1)
+            continue
+        resync = False
+
+        active = [s for s in sessions.values() if s.oco_orders]
+        if not active:
             await asyncio.sleep(0.3)
             continue
 
-        token, _ = get_token()
+        token = await get_token()
         if not token:
             await asyncio.sleep(0.3)
             continue
 
-        response = api_post(token, "/api/Order/searchOpen", {"accountId": ACCOUNT_ID})
-        orders = response.get("orders", [])
-        active_ids = {o["id"] for o in orders if "id" in o}
-
-        for entry_id, linked_ids in list(oco_orders.items()):
-            if not entry_id or not all(linked_ids):
-                continue
+        started = time.monotonic()
+        MONITOR_POLLS.inc()
+        await asyncio.gather(*(reconcile_open_orders(token, s) for s in active))
+        poll_policy.observe_latency(time.monotonic() - started)
+
+        distances = [
+            group_distance(s.oco_store.meta.get(entry_id, {}))
+            for s in active for entry_id in s.oco_orders
+        ]
+        monitor_wake.clear()
+        try:
+            await asyncio.wait_for(monitor_wake.wait(), poll_policy.next_interval(distances))
+        except asyncio.TimeoutError:
+            pass
+        # Stream reconnected while we were polling: do one more pass to catch up
+        resync = stream_connected()
+
+async def get_accounts(token):
+    """Return {accountId: account} for every trading account of this login."""
+    try:
+        accounts = await gateway.get_user("/TradingAccount", token=token, timeout=5)
+        if not isinstance(accounts, list) or not accounts:
+            logging.warning("No account data found.")
+            return None
 
-            tp_id, sl_id = linked_ids
-            tp_missing = tp_id not in active_ids
-            sl_missing = sl_id not in active_ids
+        found = {a.get("accountId"): a for a in accounts if a.get("accountId") in ACCOUNT_IDS}
+        for account_id in ACCOUNT_IDS:
+            if account_id not in found:
+                logging.warning(f"No account found with id: {account_id}")
+        return found or None
+    except Exception as e:
+        check_unauthorized(e, token)
+        logging.error(f"Account info fetch error: {e}")
+        return None
 
-            # If either SL or TP is triggered, cancel the other
-            if tp_missing or sl_missing:
-                remaining_id = sl_id if tp_missing else tp_id
-                if remaining_id in active_ids:
-                    success = cancel_order(token, ACCOUNT_ID, remaining_id)
-                    if success:
-                        logging.info(f"Canceled remaining OCO leg: {remaining_id}")
-                    else:
-                        logging.warning(f"Failed to cancel remaining leg: {remaining_id}")
-                else:
-                    logging.info(f"Remaining leg already inactive: {remaining_id}")
+async def fetch_accounts():
+    if not is_leader():
+        try:
+            accounts = await leader_client.call("accounts")
+        except Exception as e:
+            logging.error(f"Accounts from leader failed: {e}")
+            return None
+        return {int(k): v for k, v in accounts.items()} if accounts else None
+    token = await get_token()
+    if not token:
+        return None
+    return await get_accounts(token)
 
-                # Remove the OCO group from tracking
-                del oco_orders[entry_id]
+# One /TradingAccount call refreshes the snapshot of every account
+account_cache = AccountCache(
+    fetch_accounts,
+    refresh_interval=config.get("account_refresh_interval", 5),
+    max_staleness=config.get("account_max_staleness", 15)
+)
+account_cache.subscribe(on_accounts_changed)
 
-        await asyncio.sleep(0.3)
+async def get_account_info(account_id):
+    accounts = await account_cache.get()
+    return accounts.get(account_id) if accounts else None
 
-def get_account_info(token):
+async def search_orders(token, account_id, start, end):
     try:
-        res = requests.get(
-            "https://userapi.topstepx.com/TradingAccount",
-            headers={
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json",
-                "User-Agent": "Mozilla/5.0",
-                "x-app-type": "px-desktop",
-                "x-app-version": "1.21.1"
+        res = await gateway.post(
+            "/api/Order/search",
+            {
+                "accountId": account_id,
+                "startTimestamp": start.isoformat(),
+                "endTimestamp": end.isoformat()
             },
-            verify=False
+            token=token,
+            timeout=5,
+            priority=PRIORITY_BACKGROUND
         )
-        res.raise_for_status()
-        accounts = res.json()
-        if not isinstance(accounts, list) or not accounts:
-            logging.warning("No account data found.")
-            return None
+        return res.get("orders", [])
+    except Exception as e:
+        check_unauthorized(e, token)
+        logging.error(f"Order search error: {e}")
+        return None
 
-        for account in accounts:
-            if account.get("accountId") == ACCOUNT_ID:
-                return account
+async def search_account_orders(account_id, start, end):
+    token = await get_token()
+    if not token:
+        return None
+    return await search_orders(token, account_id, start, end)
 
-        logging.warning(f"No account found with id: {ACCOUNT_ID}")
+async def search_open_orders(account_id):
+    token = await get_token()
+    if not token:
         return None
+    try:
+        res = await gateway.post(
+            "/api/Order/searchOpen",
+            {"accountId": account_id},
+            token=token,
+            timeout=5,
+            priority=PRIORITY_BACKGROUND
+        )
+        return res.get("orders", [])
     except Exception as e:
-        logging.error(f"Account info fetch error: {e}")
+        check_unauthorized(e, token)
+        logging.error(f"Open order search error: {e}")
         return None
 
-def search_order_by_id(token, account_id, order_id):
+async def fetch_watched_orders(order_history, order_ids):
+    if not await order_history.sync(order_ids):
+        return None
+    return {i: order_history.get(i) for i in order_ids if order_history.get(i)}
+
+async def wait_for_fill_and_place_tp(session, entry_id, contract_id, side, size, tp, token):
+    entry_order = await session.fill_watcher.wait(entry_id)
+
+    # ✅ Check if entry is still tracked
+    if entry_id not in session.oco_orders:
+        logging.info(f"Entry {entry_id} no longer tracked. Skipping TP placement.")
+        return
+
+    if not entry_order:
+        logging.warning(f"Entry order {entry_id} not filled or not found. Skipping TP.")
+        session.oco_store.remove(entry_id, "entry not filled")
+        risk.release(session.account_id, entry_id)
+        record_oco(session, entry_id, "close", reason="entry not filled")
+        return
+
+    filled_price = entry_order.get("filledPrice")
+    note_fill_price(entry_order)
+    if stream_connected():
+        # The stream's update has been recorded and pushed already
+        journal.record("order", account=session.account_id, order=entry_id,
+                       status=entry_order.get("status"), filledPrice=filled_price)
+    else:
+        record_order(session.account_id, entry_id, entry_order.get("status"), filled_price)
+    logging.info(f"Entry {entry_id} filled at {filled_price}. Placing TP...")
+    account_cache.invalidate()
+    started = time.perf_counter()
+
+    tp_order = await session.order_pipeline.submit({
+        "accountId": session.account_id,
+        "contractId": contract_id,
+        "type": 1,
+        "side": 1 - side,
+        "size": size,
+        "limitPrice": tp,
+        "linkedOrderId": entry_id
+    }, "target")
+    TP_PLACED.observe(time.perf_counter() - started)
+
+    if entry_id in session.oco_orders:
+        session.oco_store.set_leg(entry_id, 0, tp_order.get("orderId"))
+        record_oco(session, entry_id, "target", order=tp_order.get("orderId"))
+    elif tp_order.get("orderId"):
+        # The stop closed the group while the TP was in flight; a TP left
+        # working now would open a new position
+        logging.warning(f"Entry {entry_id} closed before its TP was acked, canceling TP {tp_order['orderId']}")
+        if not await cancel_order(await get_token(), session.account_id, tp_order["orderId"]):
+            logging.error(f"Failed to cancel orphaned TP {tp_order['orderId']}")
+            Alert(f"TP {tp_order['orderId']} on account {session.account_id} is live but unmanaged: its OCO group closed")
+
+# --- Order Submission ---
+async def place_order(payload, timeout=None):
+    token = await get_token()
+    if not token:
+        return {}
+    return await api_post(token, "/api/Order/place", payload, timeout=timeout)
+
+async def find_order_by_tag(session, tag):
+    """Look for an order we may already have placed, open ones first."""
+    token = await get_token()
+    if not token:
+        return None
+    response = await api_post(token, "/api/Order/searchOpen", {"accountId": session.account_id})
+    for order in response.get("orders", []):
+        if order.get("customTag") == tag:
+            return order
+    if await session.order_history.sync():
+        for order in session.order_history.orders.values():
+            if order.get("customTag") == tag:
+                return order
+    return None
+
+# --- Risk ---
+risk = RiskEngine(
+    risk_fraction=config.get("risk_fraction", 0.3094),
+    max_contracts=config.get("max_contracts", 3),
+    large_tick_value=config.get("large_tick_value", 5),
+    large_tick_budget=config.get("large_tick_budget", 889),
+    large_tick_max_contracts=config.get("large_tick_max_contracts", 2)
+)
+
+async def sync_open_risk(account_id):
+    """Followers size against the leader's book; the leader's is already current."""
+    if is_leader():
+        return
     try:
-        now = datetime.datetime.utcnow()
-        start = (now - datetime.timedelta(minutes=5)).isoformat() + "+00:00"
-        end = (now + datetime.timedelta(minutes=1)).isoformat() + "+00:00"
+        risk.open(account_id, "leader", await leader_client.call("open_risk", account=account_id))
+    except Exception as e:
+        logging.warning(f"Open risk from leader failed: {e}")
 
-        res = requests.post(
-            f"{API_URL}/api/Order/search",
-            json={
-                "accountId": account_id,
-                "startTimestamp": start,
-                "endTimestamp": end
-            },
-            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-            verify=False
-        )
-        res.raise_for_status()
-        orders = res.json().get("orders", [])
-        return next((o for o in orders if o.get("id") == order_id), None)
+async def reserve_risk(account_id, amount, limit):
+    """Reservation key, or None when the budget can't take `amount`. Raises when the leader can't be asked."""
+    if is_leader():
+        return risk.reserve(account_id, amount, limit)
+    return await leader_client.call("reserve", account=account_id, amount=amount, limit=limit)
+
+async def release_risk(account_id, key):
+    if is_leader():
+        risk.release(account_id, key)
+        return
+    try:
+        await leader_client.call("release", account=account_id, key=key)
     except Exception as e:
-        logging.error(f"Order search error: {e}")
-        return None
-    
-async def wait_for_fill_and_place_tp(entry_id, contract_id, side, size, tp, token):
-    while True:
-        await asyncio.sleep(0.3)
+        logging.warning(f"Releasing risk on the leader failed: {e}")
+
+# --- Account Sessions ---
+def make_session(account_id, clock=time.monotonic):
+    # The default account keeps the original state location so existing
+    # OCO journals are picked up; extra accounts get a directory each
+    state_dir = STATE_DIR if account_id == ACCOUNT_ID else os.path.join(STATE_DIR, str(account_id))
+    oco_store = OcoStore(
+        state_dir,
+        compact_every=config.get("oco_compact_every", 1000)
+    )
+    order_history = OrderHistory(
+        functools.partial(search_account_orders, account_id),
+        lookback=config.get("order_history_lookback", 300),
+        max_orders=config.get("order_history_size", 5000),
+        search_open=functools.partial(search_open_orders, account_id)
+    )
+    fill_watcher = FillWatcher(
+        functools.partial(fetch_watched_orders, order_history),
+        interval=0.3,
+        is_streaming=stream_connected,
+        not_found_grace=config.get("fill_not_found_grace", 30),
+        clock=clock
+    )
+    session = AccountSession(account_id, oco_store, order_history, fill_watcher, None)
+    session.order_pipeline = OrderPipeline(
+        place_order,
+        functools.partial(find_order_by_tag, session),
+        retries=config.get("order_retries", 2),
+        timeout=config.get("order_timeout", 5)
+    )
+    return session
+
+for account_id in ACCOUNT_IDS:
+    sessions[account_id] = make_session(account_id)
+
+def resolve_sessions(data):
+    """
+    Accounts a request targets: `accountIds` (a list, or "all") fans out,
+    `accountId` picks one, otherwise the default account. Returns
+    (sessions, error).
+    """
+    account_ids = data.get("accountIds")
+    if account_ids == "all":
+        return list(sessions.values()), None
+    if account_ids is None:
+        account_ids = [data.get("accountId", ACCOUNT_ID)]
+    try:
+        account_ids = [int(a) for a in account_ids]
+    except (TypeError, ValueError):
+        return None, "Invalid account id"
+    unknown = [a for a in account_ids if a not in sessions]
+    if unknown:
+        return None, f"Unknown account: {unknown}"
+    return [sessions[a] for a in account_ids], None
+
+# --- Bracket Placement ---
+BRACKET_MODE = config.get("bracket_mode", "client")  # "client", "native" or "auto"
+native_bracket_unsupported = set()  # (account_id, contract_id) pairs that rejected native brackets
+bracket_timings = {"native": [], "client": []}  # recent request-to-protection times, ms
+
+def bracket_mode_for(account_id, contract_id):
+    if BRACKET_MODE == "native":
+        return "native"
+    if BRACKET_MODE == "auto" and (account_id, contract_id) not in native_bracket_unsupported:
+        return "native"
+    return "client"
+
+def is_bracket_unsupported(response):
+    return "bracket" in (response.get("errorMessage") or "").lower()
+
+def record_bracket_timing(mode, started):
+    elapsed = time.perf_counter() - started
+    PROTECTED.observe(elapsed, mode)
+    elapsed_ms = round(elapsed * 1000, 1)
+    timings = bracket_timings[mode]
+    timings.append(elapsed_ms)
+    del timings[:-100]
+    logging.info(f"{mode} bracket protected in {elapsed_ms} ms (avg {sum(timings) / len(timings):.1f} ms over {len(timings)})")
+    return elapsed_ms
+
+async def place_native_bracket(session, token, contract, entry_type, side, size, op, tp, sl, custom_tag):
+    """Entry with server-side stop and target brackets, in one gateway call."""
+    ticks_sl = contract.ticks_between(op, sl)
+    ticks_tp = contract.ticks_between(tp, op)
+    if (side == 0): ticks_sl *= -1
+    else: ticks_tp *= -1
+
+    # https://gateway.docs.projectx.com/docs/api-reference/order/order-place
+    return await session.order_pipeline.submit({
+        "accountId": session.account_id,
+        "contractId": contract.contractId,
+        "type": entry_type,
+        "side": side,
+        "size": size,
+        "limitPrice": op if entry_type == 1 else None,
+        "stopPrice": op if entry_type == 4 else None,
+        "stopLossBracket": {
+            "ticks": ticks_sl,
+            "type": 4  # Stop
+        },
+        "takeProfitBracket": {
+            "ticks": ticks_tp,
+            "type": 1  # Limit
+        }
+    }, "entry", tag_prefix=custom_tag)
+
+async def place_client_bracket(session, token, contract_id, entry_type, side, size, op, tp, sl, custom_tag=None, received=None, reservation=None):
+    """
+    Entry, then the legs that don't depend on the fill, sent together as
+    soon as the entry is acked. Today that is the linked stop; the TP goes
+    in once the fill watcher sees the entry fill. The group is then handed
+    to the OCO engine along with its risk `reservation`. Returns
+    (entry_id, error).
+    """
+    placed_at = datetime.datetime.now(datetime.timezone.utc)
+    entry = await session.order_pipeline.submit({
+        "accountId": session.account_id,
+        "contractId": contract_id,
+        "type": entry_type,
+        "side": side,
+        "size": size,
+        "limitPrice": op if entry_type == 1 else None,
+        "stopPrice": op if entry_type == 4 else None
+    }, "entry", tag_prefix=custom_tag)
+    entry_id = entry.get("orderId")
+    if not entry.get("success") or not entry_id:
+        return None, "Entry order failed"
+    acked = time.perf_counter()
+    ENTRY_ACK.observe(acked - (received or acked), "client")
+
+    (sl_order,) = await session.order_pipeline.submit_legs([
+        ("stop", {
+            "accountId": session.account_id,
+            "contractId": contract_id,
+            "type": 4,
+            "side": 1 - side,
+            "size": size,
+            "stopPrice": sl,
+            "linkedOrderId": entry_id
+        }),
+    ], tag_prefix=custom_tag)
+    STOP_ACK.observe(time.perf_counter() - acked)
+    if not sl_order.get("success"):
+        logging.error(f"Stop leg for entry {entry_id} failed: {sl_order.get('errorMessage')}")
+
+    await track_group(session, entry_id, sl_order.get("orderId"), reservation, {
+        "contractId": contract_id,
+        "side": side,
+        "size": size,
+        "op": op,
+        "tp": tp,
+        "sl": sl,
+        # Where a restart's order search has to reach back to for this entry
+        "placedAt": placed_at.isoformat()
+    })
+    return entry_id, None
 
-        # ✅ Check if entry is still tracked
-        if entry_id not in oco_orders:
-            logging.info(f"Entry {entry_id} no longer tracked. Skipping TP placement.")
-            return
+def adopt_group(session, entry_id, stop_id, reservation, meta):
+    """Start managing a placed bracket: watch for the entry fill, then the OCO legs."""
+    # Launch background task to wait for entry fill before placing TP
+    spawn(wait_for_fill_and_place_tp(
+        session,
+        entry_id=entry_id,
+        contract_id=meta["contractId"],
+        side=meta["side"],
+        size=meta["size"],
+        tp=meta["tp"],
+        token=None
+    ))
+    session.oco_store.add(entry_id, [None, stop_id], **meta)
+    session.order_history.note_placed(entry_id, meta.get("placedAt"))
+    if reservation is not None:
+        risk.commit(session.account_id, reservation, entry_id)
+    record_oco(session, entry_id, "open", stop=stop_id)
+    watch_contract(meta["contractId"])
+    monitor_wake.set()
+
+# --- Native Bracket Risk ---
+# The gateway manages native brackets' legs, so their risk stays booked
+# until a /searchOpen shows neither the entry nor any newer non-entry order
+# on its contract still working, i.e. the entry was dropped or the
+# position exited
+native_open = {}  # (account_id, entry_id) → contract_id
+NATIVE_EXIT_INTERVAL = config.get("native_exit_interval", 5)
+
+def adopt_native(session, entry_id, contract_id, reservation):
+    if reservation is not None:
+        risk.commit(session.account_id, reservation, entry_id)
+    native_open[(session.account_id, entry_id)] = contract_id
+
+async def track_native(session, entry_id, contract_id, reservation):
+    if is_leader():
+        adopt_native(session, entry_id, contract_id, reservation)
+        return
+    try:
+        await leader_client.call(
+            "track_native", account=session.account_id, entry=entry_id, contractId=contract_id, reservation=reservation
+        )
+    except Exception as e:
+        logging.warning(f"Handing native bracket {entry_id} to the leader failed ({e}), its risk is not tracked")
+        await release_risk(session.account_id, reservation)
 
-        token, _ = get_token()
+async def watch_native_exits():
+    while True:
+        await asyncio.sleep(NATIVE_EXIT_INTERVAL)
+        if not native_open:
+            continue
+        token = await get_token()
         if not token:
             continue
-
-        entry_order = search_order_by_id(token, ACCOUNT_ID, entry_id)
-        if not entry_order:
-            logging.warning(f"Entry order {entry_id} not found in search. Skipping TP.")
-            del oco_orders[entry_id]
+        for account_id in {account_id for account_id, _ in native_open}:
+            response = await api_post(
+                token, "/api/Order/searchOpen", {"accountId": account_id}, priority=PRIORITY_BACKGROUND
+            )
+            if "orders" not in response:
+                continue
+            open_ids = {order.get("id") for order in response["orders"]}
+            legs = {}  # contract_id → newest working order that isn't a tracked entry
+            for order in response["orders"]:
+                if (account_id, order.get("id")) not in native_open:
+                    contract_id = order.get("contractId")
+                    legs[contract_id] = max(legs.get(contract_id, 0), order.get("id") or 0)
+            for (account, entry_id), contract_id in list(native_open.items()):
+                if account == account_id and entry_id not in open_ids and legs.get(contract_id, 0) < entry_id:
+                    del native_open[(account, entry_id)]
+                    risk.release(account, entry_id)
+                    logging.info(f"Native bracket {entry_id} done, released its risk")
+
+async def track_group(session, entry_id, stop_id, reservation, meta):
+    """
+    adopt_group() here on the leader, or on the leader from a follower.
+    The bracket is already live, so keep trying through a leader change.
+    """
+    for attempt in range(LEADER_ADOPT_RETRIES):
+        if is_leader():
+            adopt_group(session, entry_id, stop_id, reservation, meta)
             return
-
-        filled_price = entry_order.get("filledPrice")
-        if filled_price is not None:
-            logging.info(f"Entry {entry_id} filled at {filled_price}. Placing TP...")
-
-            tp_order = api_post(token, "/api/Order/place", {
-                "accountId": ACCOUNT_ID,
-                "contractId": contract_id,
-                "type": 1,
-                "side": 1 - side,
-                "size": size,
-                "limitPrice": tp,
-                "linkedOrderId": entry_id
-            })
-
-            if entry_id in oco_orders:
-                oco_orders[entry_id][0] = tp_order.get("orderId")
+        try:
+            await leader_client.call(
+                "adopt", account=session.account_id, entry=entry_id, stop=stop_id, reservation=reservation, meta=meta
+            )
             return
-        else:
-            logging.info(f"Entry {entry_id} not filled yet. Retrying...")
+        except Exception as e:
+            logging.warning(f"Handing entry {entry_id} to the leader failed ({e}), retrying")
+            await asyncio.sleep(0.5)
+    logging.error(f"Entry {entry_id} is live but no leader took it over")
+    Alert(f"Entry {entry_id} on account {session.account_id} is live but unmanaged: no OCO leader reachable")
 
 # --- Place OCO ---
-async def place_oco_generic(data, entry_type):
-    def get_precision(tick_size):
-        """
-        Returns the number of decimal places needed to represent tick_size cleanly.
-        Example:
-        0.1   → 1
-        0.25  → 2
-        0.01  → 2
-        0.0001 → 4
-        """
-        if tick_size == 0:
-            return 0
-        return max(0, -int(math.floor(math.log10(tick_size))))
-
-    def round_to_tick(value, tick_size):
-        precision = get_precision(tick_size)
-        ticks = math.floor(value / tick_size)
-        floored = ticks * tick_size
-        return round(floored, precision)
-
+async def place_oco_for_account(session, data, entry_type, token=None, account_info=None):
+    """
+    Size and place one bracket on one account. Returns (body, status).
+    A batch passes the token and account snapshot it already holds.
+    """
+    received = time.perf_counter()
     quantity = int(data.get("quantity", 1))
     op = data.get("op")
     tp = data.get("tp")
@@ -335,68 +948,81 @@ async def place_oco_generic(data, entry_type):
 
     contract = contract_map.get(symbol)
     if not contract:
-        return jsonify({"error": f"Unknown symbol: {symbol}"}), 400
+        return {"error": f"Unknown symbol: {symbol}"}, 400
 
-    tick_size = contract["tickSize"]
-    tick_value = contract["tickValue"]
-    contract_id = contract["contractId"]
+    tick_size = contract.tickSize
+    tick_value = contract.tickValue
+    contract_id = contract.contractId
 
     # Round prices to tick size
-    op = round_to_tick(op, tick_size)
-    tp = round_to_tick(tp, tick_size)
-    sl = round_to_tick(sl, tick_size)
+    op = contract.round_to_tick(op)
+    tp = contract.round_to_tick(tp)
+    sl = contract.round_to_tick(sl)
 
-    if op > sl: op += tick_size * 2
+    if op > sl: op = contract.add_ticks(op, 2)
 
-    token, account_info = get_token()
-    if not token or not account_info:
-        return jsonify({"error": "Authentication failed"}), 500
+    if token is None:
+        token = await get_token()
+    if not token:
+        return {"error": "Authentication failed"}, 500
+
+    if account_info is None:
+        account_info = await get_account_info(session.account_id)
+    if not account_info:
+        return {"error": "Failed to fetch account data"}, 500
 
     balance = account_info.get("balance")
     maximum_loss = account_info.get("maximumLoss")
     if balance is None or maximum_loss is None:
-        return jsonify({"error": "Missing account data"}), 500
+        return {"error": "Missing account data"}, 500
 
-    sl_ticks = abs(op - sl) / tick_size
+    sl_ticks = contract.ticks_between(op, sl)
     if sl_ticks == 0:
-        return jsonify({"error": "SL too close to OP"}), 400
+        return {"error": "SL too close to OP"}, 400
 
-    risk_budget = (balance - maximum_loss) * 0.3094 #0.24
-    quantity = int(risk_budget / (sl_ticks * tick_value))
-    if quantity > 2 and tick_value >= 5 and risk_budget < 889:
-        quantity = 2
-    print(risk_budget)
+    # What is left of the account's budget after its live brackets
+    await sync_open_risk(session.account_id)
+    risk_budget = risk.budget(session.account_id, balance, maximum_loss)
+    quantity = risk.size(risk_budget, sl_ticks, tick_value)
     if quantity <= 0:
-        return jsonify({"error": "Calculated quantity is zero"}), 400
+        if risk.open_risk(session.account_id):
+            return {"error": "Risk budget taken by open brackets", "openRisk": risk.open_risk(session.account_id)}, 400
+        return {"error": "Calculated quantity is zero"}, 400
 
-    micro_to_standard = {
-        "MNQ": "NQ",
-        "MYM": "YM",
-        "MGC": "GC",
-        "MES": "ES"
-    }
+    standard = contract_map.standard_for(symbol)
+    if quantity >= 10 and standard is not None:
+        symbol = standard.symbol
 
-    if quantity >= 10 and symbol in micro_to_standard:
-        symbol = micro_to_standard[symbol]
-        contract = contract_map.get(symbol)
-        if not contract:
-            return jsonify({"error": f"Standard symbol not found: {symbol}"}), 400
-        contract_id = contract["contractId"]
-        tick_size = contract["tickSize"]
-        tick_value = contract["tickValue"]
-        quantity = int(risk_budget / (sl_ticks * tick_value))
+        # Prices are already on the micro grid; only re-round if the grids differ
+        if standard.tick != contract.tick:
+            op = standard.round_to_tick(op)
+            tp = standard.round_to_tick(tp)
+            sl = standard.round_to_tick(sl)
+            sl_ticks = standard.ticks_between(op, sl)
 
-        # Re-round prices to new tick size
-        op = round_to_tick(op, tick_size)
-        tp = round_to_tick(tp, tick_size)
-        sl = round_to_tick(sl, tick_size)
+        contract = standard
+        contract_id = contract.contractId
+        tick_size = contract.tickSize
+        tick_value = contract.tickValue
+        quantity = risk.size(risk_budget, sl_ticks, tick_value)
 
-    if quantity > 3:
-        quantity = 3
+    quantity = risk.cap(quantity)
 
     side = 0 if op < tp else 1
     size = abs(quantity)
+
+    # Catch what the exchange would reject before spending a round trip on it
+    quote = await current_quote(contract_id)
+    requested_type = entry_type
+    entry_type = choose_entry_type(side, op, quote, entry_type)
+    error = check_bracket(side, op, sl, quote, entry_type)
+    if error:
+        return {"error": error}, 400
+    if entry_type != requested_type:
+        logging.info(f"Market already through {op} on {contract_id}, entering with a limit instead of a stop")
+
     message = {
+        "accountId": session.account_id,
         "contract": contract_id,
         "side": side,
         "size": size,
@@ -408,7 +1034,7 @@ async def place_oco_generic(data, entry_type):
         "risk_budget": risk_budget,
         "message": "OCO placed"
     }
-    print(message)
+    journal.record("sizing", **message)
     Alert(json.dumps(message))
     # return jsonify({
     #     "contract": contract_id,
@@ -419,90 +1045,179 @@ async def place_oco_generic(data, entry_type):
     #     "risk_budget": risk_budget,
     #     "message": "OCO placed"
     # })
-    entry = api_post(token, "/api/Order/place", {
-        "accountId": ACCOUNT_ID,
-        "contractId": contract_id,
-        "type": entry_type,
-        "side": side,
-        "size": size,
-        "limitPrice": op if entry_type == 1 else None,
-        "stopPrice": op if entry_type == 4 else None
-    })
-    # ticks_sl = int(abs(op - sl) / tick_size)
-    # ticks_tp = int(abs(tp - op) / tick_size)
-    # if (side == 0): ticks_sl *= -1
-    # else: ticks_tp *= -1
-
-    # # https://gateway.docs.projectx.com/docs/api-reference/order/order-place
-    # entry = api_post(token, "/api/Order/place", {
-    #     "accountId": ACCOUNT_ID,
-    #     "contractId": contract_id,
-    #     "type": entry_type,
-    #     "side": side,
-    #     "size": size,
-    #     "limitPrice": op if entry_type == 1 else None,
-    #     "stopPrice": op if entry_type == 4 else None,
-    #     "customTag": custom_tag,
-    #     "stopLossBracket": {
-    #         "ticks": ticks_sl,
-    #         "type": 4  # Stop
-    #     },
-    #     "takeProfitBracket": {
-    #         "ticks": ticks_tp,
-    #         "type": 1  # Limit
-    #     }
-    # })
-    # print(entry)
-    entry_id = entry.get("orderId")
-    if not entry.get("success") or not entry_id:
-        return jsonify({"error": "Entry order failed"}), 500
-
-    # await asyncio.sleep(0.3)
-    # tp_order = api_post(token, "/api/Order/place", {
-    #     "accountId": ACCOUNT_ID,
-    #     "contractId": contract_id,
-    #     "type": 1,
-    #     "side": 1 - side,
-    #     "size": size,
-    #     "limitPrice": tp,
-    #     "linkedOrderId": entry_id
-    # })
-    await asyncio.sleep(0.3)
-    sl_order = api_post(token, "/api/Order/place", {
-        "accountId": ACCOUNT_ID,
-        "contractId": contract_id,
-        "type": 4,
-        "side": 1 - side,
-        "size": size,
-        "stopPrice": sl,
-        "linkedOrderId": entry_id
-    })
-    # print(sl_order)
-
-    # Launch background task to wait for entry fill before placing TP
-    asyncio.create_task(wait_for_fill_and_place_tp(
-        entry_id=entry_id,
-        contract_id=contract_id,
-        side=side,
-        size=size,
-        tp=tp,
-        token=token
-    ))
-
-    oco_orders[entry_id] = [None, sl_order.get("orderId")]
-
-    return jsonify({
-        "entryOrderId": entry_id,
-        # "takeProfitOrderId": tp_order.get("orderId"),
-        # "stopLossOrderId": sl_order.get("orderId"),
-        "contractId": contract_id,
+    # Reserve before placing so concurrent signals, in any worker, see this bracket;
+    # the limit re-checks the budget where the book lives
+    try:
+        reservation = await reserve_risk(
+            session.account_id,
+            risk.bracket_risk(size, sl_ticks, tick_value),
+            (balance - maximum_loss) * risk.risk_fraction
+        )
+    except Exception as e:
+        # No leader to book against, e.g. mid-takeover; nothing was placed
+        logging.warning(f"Reserving risk on the leader failed: {e}")
+        return {"error": "Risk book unavailable"}, 503
+    if reservation is None:
+        return {"error": "Risk budget taken by open brackets"}, 400
+    body, status = {"error": "Entry order failed"}, 500
+    try:
+        body, status = await submit_bracket(
+            session, token, contract, entry_type, side, size, op, tp, sl, custom_tag, received, reservation
+        )
+    finally:
+        if status != 200:
+            await release_risk(session.account_id, reservation)
+    if status != 200:
+        return body, status
+
+    await sync_open_risk(session.account_id)
+    return dict(body, **{
+        "accountId": session.account_id,
+        "contractId": contract.contractId,
         "tickSize": tick_size,
         "tickValue": tick_value,
         "balance": balance,
         "maximum_loss": maximum_loss,
         "risk_budget": risk_budget,
+        "openRisk": risk.open_risk(session.account_id),
+        "entryType": entry_type,
         "message": "OCO placed"
-    })
+    }), 200
+
+async def submit_bracket(session, token, contract, entry_type, side, size, op, tp, sl, custom_tag, received, reservation=None):
+    """Place a sized bracket natively or client-side. Returns (body, status)."""
+    contract_id = contract.contractId
+    started = time.perf_counter()
+    mode = bracket_mode_for(session.account_id, contract_id)
+    if mode == "native":
+        entry = await place_native_bracket(session, token, contract, entry_type, side, size, op, tp, sl, custom_tag)
+        if entry.get("success") and entry.get("orderId"):
+            entry_id = entry["orderId"]
+            ENTRY_ACK.observe(time.perf_counter() - received, "native")
+            await track_native(session, entry_id, contract_id, reservation)
+        elif BRACKET_MODE == "auto" and is_bracket_unsupported(entry):
+            logging.warning(f"Native brackets rejected for {contract_id}, using client-managed OCO")
+            native_bracket_unsupported.add((session.account_id, contract_id))
+            mode = "client"
+        else:
+            return {"error": "Entry order failed"}, 500
+
+    if mode == "client":
+        entry_id, error = await place_client_bracket(
+            session, token, contract_id, entry_type, side, size, op, tp, sl, custom_tag,
+            received=received, reservation=reservation
+        )
+        if error:
+            return {"error": error}, 500
+
+    elapsed_ms = record_bracket_timing(mode, started)
+
+    return {
+        "entryOrderId": entry_id,
+        # "takeProfitOrderId": tp_order.get("orderId"),
+        # "stopLossOrderId": sl_order.get("orderId"),
+        "bracketMode": mode,
+        "elapsedMs": elapsed_ms,
+    }, 200
+
+request_ids = itertools.count(1)  # ties journaled responses to their request
+
+def record_response(req, account_id, status, body, index=None):
+    """Journal one account's result and push it as an order acknowledgement."""
+    if index is None:
+        journal.record("response", req=req, account=account_id, status=status, body=body)
+    else:
+        journal.record("response", req=req, index=index, account=account_id, status=status, body=body)
+    publish("ack", dict(body, accountId=account_id, status=status, index=index))
+
+async def place_oco_generic(data, entry_type):
+    req = next(request_ids)
+    journal.record("request", req=req, entryType=entry_type, body=data)
+    targets, error = resolve_sessions(data)
+    if error:
+        journal.record("response", req=req, status=400, body={"error": error})
+        return jsonify({"error": error}), 400
+
+    if len(targets) == 1 and "accountIds" not in data:
+        body, status = await place_oco_for_account(targets[0], data, entry_type)
+        record_response(req, targets[0].account_id, status, body)
+        return jsonify(body), status
+
+    # Fan out: every account sizes against its own balance, all at once
+    results = await asyncio.gather(*(place_oco_for_account(s, data, entry_type) for s in targets))
+    for s, (body, status) in zip(targets, results):
+        record_response(req, s.account_id, status, body)
+    placed = [dict(body, accountId=s.account_id, status=status) for s, (body, status) in zip(targets, results)]
+    ok = any(status == 200 for _, status in results)
+    return jsonify({"results": placed}), 200 if ok else 500
+
+BATCH_MAX_ORDERS = config.get("batch_max_orders", 20)
+
+async def place_oco_batch_stream(req, jobs, token, accounts):
+    """Place every (index, session, order, entry_type) job at once, yield NDJSON lines as they finish."""
+    async def one(index, session, order, entry_type):
+        # The 200 is already out, so a failing order becomes its own line
+        try:
+            body, status = await place_oco_for_account(
+                session, order, entry_type, token=token, account_info=accounts.get(session.account_id)
+            )
+        except Exception as e:
+            logging.exception(f"Batch order {index} on account {session.account_id} failed")
+            body, status = {"error": f"Order failed: {e}"}, 500
+        record_response(req, session.account_id, status, body, index=index)
+        return dict(body, index=index, accountId=session.account_id, status=status)
+
+    for result in asyncio.as_completed([one(*job) for job in jobs]):
+        yield (json.dumps(await result) + "\n").encode()
+
+async def place_oco_batch_generic(data):
+    """
+    Several brackets in one request: {"orders": [...]} plus optional
+    fields shared by every order (accountId, accountIds, ...). Each order
+    is a /place-oco body, with "entryType": 4 for a stop entry. Auth and
+    the account snapshot are fetched once, then every entry goes out
+    concurrently and each result is streamed back as one NDJSON line in
+    completion order, tagged with its index in "orders".
+    """
+    req = next(request_ids)
+    journal.record("request", req=req, entryType="batch", body=data)
+
+    def reject(error, status=400):
+        journal.record("response", req=req, status=status, body={"error": error})
+        return jsonify({"error": error}), status
+
+    orders = data.get("orders") if isinstance(data, dict) else None
+    if not isinstance(orders, list) or not orders:
+        return reject("orders must be a non-empty list")
+    if len(orders) > BATCH_MAX_ORDERS:
+        return reject(f"At most {BATCH_MAX_ORDERS} orders per batch")
+
+    shared = {k: v for k, v in data.items() if k != "orders"}
+    jobs = []
+    for index, order in enumerate(orders):
+        if not isinstance(order, dict):
+            return reject(f"Order {index} is not an object")
+        order = dict(shared, **order)
+        entry_type = order.get("entryType", 1)
+        if entry_type not in (1, 4):
+            return reject(f"Order {index}: entryType must be 1 (limit) or 4 (stop)")
+        for field in ("op", "tp", "sl"):
+            value = order.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return reject(f"Order {index}: {field} must be a number")
+        targets, error = resolve_sessions(order)
+        if error:
+            return reject(f"Order {index}: {error}")
+        jobs.extend((index, session, order, entry_type) for session in targets)
+
+    token = await get_token()
+    if not token:
+        return reject("Authentication failed", 500)
+    accounts = await account_cache.get()
+    if not accounts:
+        return reject("Failed to fetch account data", 500)
+
+    return place_oco_batch_stream(req, jobs, token, accounts), 200, {"Content-Type": "application/x-ndjson"}
 
 @app.route("/")
 async def index():
@@ -514,6 +1229,40 @@ async def index():
 
     return await render_template("order_form.html", symbols=sorted_symbols)
 
+PUSH_KEEPALIVE = config.get("push_keepalive", 15)
+
+@app.route("/events", methods=["GET"])
+async def push_events():
+    """
+    Server-Sent Events: "ack", "order", "oco" and "balance" events as
+    they happen, after a "snapshot" of the account balances. A gap in
+    the event ids means this client fell behind and lost the oldest ones.
+    """
+    subscriber = events.subscribe()
+
+    async def stream():
+        try:
+            accounts = account_cache.snapshot or {}
+            yield sse({"seq": None, "event": "snapshot", "data": {"accounts": list(accounts.values())}})
+            while True:
+                try:
+                    async with asyncio.timeout(PUSH_KEEPALIVE):
+                        message = await subscriber.queue.get()
+                except TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield sse(message)
+        finally:
+            events.unsubscribe(subscriber)
+
+    response = await make_response(stream(), 200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    response.timeout = None
+    return response
+
 @app.route("/place-oco", methods=["POST"])
 async def place_oco():
     data = await request.get_json()
@@ -524,13 +1273,15 @@ async def place_oco_stop():
     data = await request.get_json()
     return await place_oco_generic(data, entry_type=4)
 
+@app.route("/place-oco-batch", methods=["POST"])
+async def place_oco_batch():
+    data = await request.get_json()
+    return await place_oco_batch_generic(data)
+
 @app.route("/balance", methods=["GET"])
 async def balance():
-    token, account_info = get_token()
-    if not token:
-        return jsonify({"error": "Authentication failed"}), 500
-
-    account_info = get_account_info(token)
+    account_id = request.args.get("accountId", ACCOUNT_ID, type=int)
+    account_info = await get_account_info(account_id)
     if not account_info:
         return jsonify({"error": "Failed to fetch account data"}), 500
 
@@ -542,19 +1293,329 @@ async def balance():
         "maximumLoss": maximum_loss
     })
 
-@app.before_serving
-async def startup():
-    load_contracts()
-    asyncio.create_task(monitor_oco_orders())
-    token, account_info = get_token()
+RATE_LIMIT_QUEUED = registry.gauge("tsx_rate_limit_queued", "Gateway calls waiting for a rate limit token", ("bucket",))
+RATE_LIMIT_TOKENS = registry.gauge("tsx_rate_limit_tokens", "Tokens left in each rate limit bucket", ("bucket",))
+OCO_GROUPS = registry.gauge("tsx_oco_groups", "Live OCO groups", ("account",))
+STREAM_UP = registry.gauge("tsx_order_stream_connected", "1 while the order stream is connected")
+ACCOUNT_AGE = registry.gauge("tsx_account_snapshot_age_seconds", "Age of the cached account snapshot")
+OPEN_RISK = registry.gauge("tsx_open_risk", "Risk committed by live brackets, in account currency", ("account",))
+PUSH_CLIENTS = registry.gauge("tsx_push_clients", "Connected /events clients")
+PUSH_DROPPED = registry.gauge("tsx_push_dropped", "Events dropped from the queues of slow /events clients")
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    """Prometheus text format. Gauges are sampled at scrape time."""
+    for name, stats in gateway.scheduler.stats().items():
+        RATE_LIMIT_QUEUED.set(stats["queued"], name)
+        RATE_LIMIT_TOKENS.set(stats["tokens"], name)
+    for account_id, session in sessions.items():
+        OCO_GROUPS.set(len(session.oco_orders), account_id)
+        OPEN_RISK.set(round(risk.open_risk(account_id), 2), account_id)
+    STREAM_UP.set(1 if stream_connected() else 0)
+    ACCOUNT_AGE.set(round(account_cache.age(), 3))
+    push = events.stats()
+    PUSH_CLIENTS.set(push["clients"])
+    PUSH_DROPPED.set(push["dropped"])
+    return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+@app.route("/rate-limits", methods=["GET"])
+async def rate_limits():
+    """Backpressure per rate limit bucket: queue depth, waits, 429s."""
+    if not is_leader():
+        try:
+            return jsonify(await leader_client.call("rate_limits"))
+        except Exception as e:
+            logging.warning(f"Rate limits from leader failed: {e}")
+    return jsonify(gateway.scheduler.stats())
+
+@app.route("/risk", methods=["GET"])
+async def risk_state():
+    """Open risk and what is left of the budget, per account."""
+    accounts = await account_cache.get() or {}
+    state = {}
+    for account_id in sessions:
+        await sync_open_risk(account_id)
+        account = accounts.get(account_id) or {}
+        budget = None
+        if account.get("balance") is not None and account.get("maximumLoss") is not None:
+            budget = round(risk.budget(account_id, account["balance"], account["maximumLoss"]), 2)
+        state[account_id] = {"openRisk": round(risk.open_risk(account_id), 2), "budget": budget}
+    return jsonify(state)
+
+@app.route("/risk/what-if", methods=["POST"])
+async def risk_what_if():
+    """
+    Size candidate orders against account budgets without placing them:
+    {"orders": [{"symbol", "op", "sl"}, ...], "accountIds": [...] or "all"}.
+    Returns one row of contracts per account, one column per order, on
+    the symbol as given (no switch to the standard contract).
+    """
+    data = await request.get_json() or {}
+    targets, error = resolve_sessions(dict(data, accountIds=data.get("accountIds", "all")))
+    if error:
+        return jsonify({"error": error}), 400
+    orders = data.get("orders")
+    if not isinstance(orders, list) or not orders:
+        return jsonify({"error": "orders must be a non-empty list"}), 400
+
+    sl_ticks, tick_values = [], []
+    for index, order in enumerate(orders):
+        contract = contract_map.get(str(order.get("symbol", "")).upper())
+        if contract is None:
+            return jsonify({"error": f"Order {index}: unknown symbol"}), 400
+        try:
+            ticks = contract.ticks_between(contract.round_to_tick(order["op"]), contract.round_to_tick(order["sl"]))
+        except (KeyError, TypeError, ArithmeticError):
+            return jsonify({"error": f"Order {index}: op and sl are required"}), 400
+        if ticks == 0:
+            return jsonify({"error": f"Order {index}: SL too close to OP"}), 400
+        sl_ticks.append(ticks)
+        tick_values.append(contract.tickValue)
+
+    accounts = await account_cache.get() or {}
+    budgets = []
+    for session in targets:
+        await sync_open_risk(session.account_id)
+        account = accounts.get(session.account_id) or {}
+        if account.get("balance") is None or account.get("maximumLoss") is None:
+            return jsonify({"error": f"Missing account data for {session.account_id}"}), 500
+        budgets.append(risk.budget(session.account_id, account["balance"], account["maximumLoss"]))
+
+    contracts = risk.what_if(budgets, sl_ticks, tick_values)
+    return jsonify({
+        "accountIds": [s.account_id for s in targets],
+        "slTicks": sl_ticks,
+        "contracts": [[int(q) for q in row] for row in contracts]
+    })
+
+async def restore_oco_state(session):
+    """
+    Reload an account's OCO groups and their risk from disk. Re-arming them
+    against the live order book needs the gateway, so it runs in the
+    background while requests are already served.
+    """
+    session.oco_store.load()
+    session.oco_store.start()
+    if not session.oco_orders:
+        return
+
+    for entry_id, meta in session.oco_store.meta.items():
+        contract = contract_for_id(meta.get("contractId"))
+        if contract is not None and meta.get("op") is not None and meta.get("sl") is not None:
+            sl_ticks = contract.ticks_between(meta["op"], meta["sl"])
+            risk.open(session.account_id, entry_id, risk.bracket_risk(meta.get("size", 0), sl_ticks, contract.tickValue))
+    spawn(rearm_oco_groups(session, list(session.oco_orders)))
+
+async def rearm_oco_groups(session, restored_ids):
+    token = await get_token()
     if not token:
-        return jsonify({"error": "Authentication failed"}), 500
-    print(account_info)
+        logging.error("OCO restore: auth error, groups will be checked by the monitor")
+        return
+    await reconcile_open_orders(token, session)
+
+    # Brackets still waiting on their entry fill need their TP watcher back;
+    # ones placed since the restart already have theirs
+    restored_ids = [entry_id for entry_id in restored_ids if entry_id in session.oco_orders]
+    for entry_id in restored_ids:
+        tp_id, sl_id = session.oco_orders[entry_id]
+        meta = session.oco_store.meta.get(entry_id, {})
+        if tp_id is None and "tp" in meta:
+            session.order_history.note_placed(entry_id, meta.get("placedAt"))
+            spawn(wait_for_fill_and_place_tp(
+                session,
+                entry_id=entry_id,
+                contract_id=meta["contractId"],
+                side=meta["side"],
+                size=meta["size"],
+                tp=meta["tp"],
+                token=token
+            ))
+    logging.info(f"Restored {len(restored_ids)} live OCO groups for account {session.account_id}")
+
+# --- Workers ---
+# With several workers exactly one, the holder of the lock file, leads:
+# it runs the OCO engine, fill watchers, streams and polling. Followers
+# only serve requests; they hand placed brackets to the leader and borrow
+# its token, account snapshot, contracts, quotes and risk book over a
+# Unix socket. A follower takes over when the leader's lock is released.
+leader_lock = LeaderLock(os.path.join(STATE_DIR, "leader.lock"))
+leader_server = None
+leader_client = LeaderClient(os.path.join(STATE_DIR, "leader.sock"), on_push=events.deliver) if WORKERS > 1 else None
+LEADER_ADOPT_RETRIES = 60  # x 0.5 s: long enough for a follower to take over
+
+def is_leader():
+    return WORKERS <= 1 or leader_lock.held
+
+async def ipc_token():
+    return await get_token()
+
+async def ipc_accounts():
+    return await account_cache.get()
+
+async def ipc_contracts():
+    return [dict(spec.to_dict(), productId=spec.productId) for spec in contract_map.values()]
+
+async def ipc_quote(contractId):
+    watch_contract(contractId)
+    quote = fresh_quote(contractId)
+    return None if quote is None else {"bid": quote.bid, "ask": quote.ask, "last": quote.last}
+
+async def ipc_open_risk(account):
+    return risk.open_risk(account)
+
+async def ipc_reserve(account, amount, limit):
+    return risk.reserve(account, amount, limit)
+
+async def ipc_release(account, key):
+    risk.release(account, key)
+
+async def ipc_adopt(account, entry, stop, reservation, meta):
+    adopt_group(sessions[account], entry, stop, reservation, meta)
+
+async def ipc_track_native(account, entry, contractId, reservation):
+    adopt_native(sessions[account], entry, contractId, reservation)
+
+async def ipc_publish(event, data):
+    publish(event, data)
+
+async def ipc_ping():
+    return os.getpid()
+
+async def ipc_acquire(buckets, priority):
+    await scheduler.acquire(buckets, priority)
+
+async def ipc_throttled(buckets, retry_after):
+    scheduler.throttled(buckets, retry_after)
+
+async def ipc_rate_limits():
+    return scheduler.stats()
+
+LEADER_HANDLERS = {
+    "token": ipc_token,
+    "accounts": ipc_accounts,
+    "contracts": ipc_contracts,
+    "quote": ipc_quote,
+    "open_risk": ipc_open_risk,
+    "reserve": ipc_reserve,
+    "release": ipc_release,
+    "adopt": ipc_adopt,
+    "track_native": ipc_track_native,
+    "publish": ipc_publish,
+    "ping": ipc_ping,
+    "acquire": ipc_acquire,
+    "throttled": ipc_throttled,
+    "rate_limits": ipc_rate_limits,
+}
+
+async def start_follower():
+    logging.info(f"Worker {os.getpid()} follows the OCO leader")
+    # One rate limit budget for all workers, in the leader; this worker's
+    # share of it only while the leader can't be reached
+    share = {name: (rate / WORKERS, max(1, burst / WORKERS)) for name, (rate, burst) in limits.items()}
+    gateway.scheduler = RemoteScheduler(
+        leader_client.call, RequestScheduler(share, reserve=config.get("rate_limit_reserve", 5))
+    )
+    for _ in range(60):  # the leader may still be starting
+        await load_contracts_from_leader()
+        if contract_map:
+            break
+        await asyncio.sleep(0.5)
+    spawn(refresh_contracts())
+    spawn(account_cache.run())
+    spawn(campaign())
+
+async def campaign():
+    """Take over as soon as the leader's lock is free."""
+    while not leader_lock.try_acquire():
+        try:
+            await leader_client.call("ping")  # keeps the event push connection open
+        except Exception:
+            pass
+        await asyncio.sleep(config.get("leader_retry_interval", 2))
+    logging.warning(f"Worker {os.getpid()} takes over as OCO leader")
+    await leader_client.close()
+    gateway.scheduler = scheduler
+    risk.clear()  # the follower's view of the leader's book; rebuilt from the OCO state
+    await start_leader(promoted=True)
+
+async def start_leader(promoted=False):
+    global leader_server
+    if WORKERS > 1:
+        logging.info(f"Worker {os.getpid()} leads the OCO engine")
+        leader_server = LeaderServer(os.path.join(STATE_DIR, "leader.sock"), LEADER_HANDLERS)
+        await leader_server.start()
+    if load_cached_contracts():
+        spawn(load_contracts())
+    else:
+        await load_contracts()
+    if not promoted:
+        spawn(refresh_contracts())
+    for session in sessions.values():
+        await restore_oco_state(session)
+        spawn(session.fill_watcher.run())
+        for meta in session.oco_store.meta.values():
+            watch_contract(meta.get("contractId"))
+    for symbol in config.get("market_data_symbols", []):
+        if symbol.upper() in contract_map:
+            watch_contract(contract_map[symbol.upper()].contractId)
+    spawn(monitor_oco_orders())
+    spawn(watch_native_exits())
+    spawn(token_manager.run())
+    if not promoted:
+        spawn(account_cache.run())
+    if order_stream is not None:
+        spawn(order_stream.run())
+    if market_data is not None:
+        spawn(market_data.run())
+    spawn(warm_up())
+
+async def warm_up():
+    """Log in and load the accounts ahead of the first order, without holding up serving."""
+    if not await get_token():
+        logging.error("Startup: authentication failed")
+        return
+    account_info = await account_cache.refresh()
+    logging.info(f"Accounts: {account_info}")
     if not account_info:
-        return jsonify({"error": "Failed to fetch account data"}), 500
+        logging.error("Startup: failed to fetch account data")
+
+@app.before_serving
+async def startup():
+    journal.start()
+    if is_leader() or leader_lock.try_acquire():
+        await start_leader()
+    else:
+        await start_follower()
+
+@app.after_serving
+async def shutdown():
+    # Before 3.12, wait_for() can turn a cancel into a timeout and a loop
+    # built on it carries on; keep cancelling until every task has ended
+    while background_tasks:
+        for task in list(background_tasks):
+            task.cancel()
+        await asyncio.wait(list(background_tasks), timeout=1)
+    for session in sessions.values():
+        session.oco_store.close()
+    if leader_server is not None:
+        await leader_server.close()
+    if leader_client is not None:
+        await leader_client.close()
+    leader_lock.release()
+    journal.close()
+    await gateway.close()
 
 def run_server():
-    app.run(host="0.0.0.0", port=5000)
+    if WORKERS <= 1:
+        app.run(host="0.0.0.0", port=5000)
+        return
+    from hypercorn.config import Config as ServerConfig
+    from hypercorn.run import run
+    server_config = ServerConfig()
+    server_config.application_path = "tsx_api_server:app"
+    server_config.bind = [config.get("bind", "0.0.0.0:5000")]
+    server_config.workers = WORKERS
+    run(server_config)
 
 if __name__ == "__main__":
     run_server()